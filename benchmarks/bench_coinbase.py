@@ -0,0 +1,131 @@
+"""
+benchmark of `surfingcrypto.coinbase` against the offline fake coinbase client.
+
+Times the account scan (`CB.get_all_accounts_with_transactions` in its
+sequential, concurrent and probe modes), `MyCoinbase.dump_accounts` and 
+`MyCoinbase.history` (full, incremental and cached) on a synthetic portfolio, 
+recording the number of API calls of each stage.
+
+Run from the repository root, eg.::
+
+    python -m benchmarks.bench_coinbase --accounts 500 --transactions 1000000 --latency 0.05 --output bench.json
+"""
+import argparse
+import json
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from surfingcrypto.coinbase import CB, MyCoinbase
+from surfingcrypto.testing import FakeClient
+
+STAGES = [
+    "scan_sequential",
+    "scan_concurrent",
+    "scan_probe",
+    "mycoinbase_start",
+    "dump_accounts",
+    "history",
+    "history_incremental_cold",
+    "history_incremental_warm",
+    "history_cache_cold",
+    "history_cache_warm",
+]
+
+
+def _measure(stage, client, func):
+    client.calls.clear()
+    t = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - t
+    result = {
+        "stage": stage,
+        "seconds": seconds,
+        "api_calls": sum(client.calls.values()),
+        "api_calls_by_method": dict(client.calls),
+    }
+    print(f"{stage:<28}{seconds:>10.3f} s{result['api_calls']:>10} calls")
+    return result
+
+
+def run(accounts=50, transactions=20000, latency=0.0, workers=8, seed=0, stages=None):
+    """
+    runs the benchmark stages.
+
+    Arguments:
+        accounts (int): number of synthetic accounts.
+        transactions (int): total number of synthetic transactions.
+        latency (float): seconds of latency of every API call.
+        workers (int): threads used in concurrent stages.
+        seed (int): seed of the synthetic portfolio.
+        stages (:obj:`list` of :obj:`str`): stages to run, default all.
+
+    Return:
+        results (:obj:`list` of :obj:`dict`): timing and API calls of each stage.
+    """
+    stages = stages or STAGES
+    client = FakeClient.synthetic(accounts, transactions, latency=latency, seed=seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch("surfingcrypto.coinbase.Client", return_value=client):
+        configuration = SimpleNamespace(
+            config={"coinbase": {"key": "fake-key", "scrt": "fake-secret"}},
+            config_folder=tmp,
+        )
+        cb = CB(configuration)
+        scans = {
+            "scan_sequential": lambda: cb.get_all_accounts_with_transactions(),
+            "scan_concurrent": lambda: cb.get_all_accounts_with_transactions(
+                max_workers=workers, requests_per_second=None),
+            "scan_probe": lambda: cb.get_all_accounts_with_transactions(
+                max_workers=workers, requests_per_second=None, probe=True),
+        }
+        for stage, func in scans.items():
+            if stage in stages:
+                results.append(_measure(stage, client, func))
+
+        if not any(stage in stages for stage in STAGES[STAGES.index("mycoinbase_start"):]):
+            return results
+        my_c = []
+        start = lambda: my_c.append(MyCoinbase(active_accounts=False, configuration=configuration))
+        if "mycoinbase_start" in stages:
+            results.append(_measure("mycoinbase_start", client, start))
+        else:
+            start()
+        my_c = my_c[0]
+        histories = {
+            "dump_accounts": my_c.dump_accounts,
+            "history": my_c.history,
+            "history_incremental_cold": lambda: my_c.history(incremental=True),
+            "history_incremental_warm": lambda: my_c.history(incremental=True),
+            "history_cache_cold": lambda: my_c.history(cache=True),
+            "history_cache_warm": lambda: my_c.history(cache=True),
+        }
+        for stage, func in histories.items():
+            if stage in stages:
+                results.append(_measure(stage, client, func))
+    return [r for r in results if r["stage"] in stages]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds of latency of every API call")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--output", help="path of the json file of results")
+    args = parser.parse_args()
+
+    results = run(args.accounts, args.transactions, args.latency, args.workers,
+                  args.seed, args.stages)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+benchmark of `surfingcrypto.portfolio_tracker` on a synthetic portfolio.
+
+Generates a ledger of buys and sells of `symbols` coins over `days` days
+and the local time series of their prices (and of the benchmark), then times
+and memory-profiles each stage of the tracker separately: loading prices,
+`portfolio_start_balance`, `time_fill` (holdings matrix and per day lots),
+the per lot calculations (`modified_cost_per_share`,
+`portfolio_end_of_year_stats`, `portfolio_start_of_year_stats`,
+`calc_returns`, `benchmark_portfolio_calcs`) and the holdings matrix ones.
+
+Peak memory is the peak of memory allocated during the stage, as traced
+by `tracemalloc` in a second run of the stage, since tracing slows down
+the allocation of python objects.
+
+Run from the repository root, eg.::
+
+    python -m benchmarks.bench_portfolio_tracker --symbols 50 --trades 100000 --days 1500 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from surfingcrypto import portfolio_tracker as pt
+
+STAGES = [
+    "load_data",
+    "set_benchmark",
+    "portfolio_start_balance",
+    "time_fill",
+    "time_fill_long",
+    "concat_lots",
+    "modified_cost_per_share",
+    "portfolio_end_of_year_stats",
+    "portfolio_start_of_year_stats",
+    "calc_returns",
+    "benchmark_portfolio_calcs",
+    "holdings_portfolio_calcs",
+]
+
+BENCHMARK = "BENCH"
+
+
+def make_ledger(symbols=20, trades=10000, days=730, seed=0, start="2019-01-01"):
+    """
+    synthetic transactions in the format of the tracker, about 60% buys.
+
+    Arguments:
+        symbols (int): number of coins.
+        trades (int): number of transactions.
+        days (int): days spanned by the transactions.
+        seed (int): seed of the random generator.
+        start (str): date of the first day.
+
+    Return:
+        :obj:`pandas.DataFrame`: transactions sorted by `Open date`.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp(start, tz="utc") + pd.to_timedelta(
+        np.sort(rng.integers(0, days * 86400, trades)), unit="s")
+    ledger = pd.DataFrame({
+        "Open date": dates,
+        "Type": np.where(rng.random(trades) < 0.6, "buy", "sell"),
+        "Symbol": rng.choice([f"C{i}" for i in range(symbols)], trades),
+        "Qty": rng.random(trades) + 0.01,
+        "Adj cost per share": rng.lognormal(3, 1, trades),
+    })
+    ledger["Adj cost"] = ledger["Qty"] * ledger["Adj cost per share"]
+    return ledger
+
+
+def write_prices(folder, coins, days, seed=0, start="2019-01-01"):
+    """
+    writes random walk daily prices of `coins` in `folder/ts/<coin>.csv`,
+    in the format of the scraper.
+    """
+    os.makedirs(os.path.join(folder, "ts"), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days + 2, freq="1D", tz="utc")
+    for coin in coins:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, len(dates))))
+        pd.DataFrame({
+            "Date": dates,
+            "Open": close,
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Volume": 0.0,
+            "Market Cap": 0.0,
+        }).to_csv(os.path.join(folder, "ts", coin + ".csv"), index=False)
+
+
+def _measure(stage, func, memory=True):
+    t = time.perf_counter()
+    out = func()
+    seconds = time.perf_counter() - t
+    result = {"stage": stage, "seconds": seconds, "peak_mb": None}
+    if memory:
+        tracemalloc.start()
+        func()
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    if isinstance(out, pd.DataFrame):
+        result["rows"] = len(out)
+    print(f"{stage:<32}{seconds:>10.3f} s{result['peak_mb'] or 0:>10.1f} MB")
+    return result, out
+
+
+def _versions():
+    versions = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+    try:
+        versions["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return versions
+
+
+def run(symbols=20, trades=10000, days=730, seed=0, stages=None, memory=True):
+    """
+    runs the benchmark stages.
+
+    Stages depend on the previous ones, which are run anyway
+    but reported only if selected.
+
+    Arguments:
+        symbols (int): number of synthetic coins.
+        trades (int): number of synthetic transactions.
+        days (int): days spanned by the transactions.
+        seed (int): seed of the synthetic portfolio.
+        stages (:obj:`list` of :obj:`str`): stages to report, default all.
+        memory (bool): profile the peak memory of each stage.
+
+    Return:
+        results (:obj:`list` of :obj:`dict`): time and peak memory of each stage.
+    """
+    stages = stages or STAGES
+    ledger = make_ledger(symbols, trades, days, seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        coins = list(ledger["Symbol"].unique())
+        write_prices(tmp, coins + [BENCHMARK], days, seed)
+        configuration = SimpleNamespace(
+            data_folder=tmp,
+            coinbase_req={coin: {"start": None, "end_day": None} for coin in coins},
+        )
+        t = pt.Tracker(ledger, configuration)
+        # start after the first trades, so that some lots are opened before it
+        t.stocks_start = t.stocks_start + pd.Timedelta(days=days // 10)
+        t.stocks_end = t.stocks_start + pd.Timedelta(days=days - days // 10)
+        out = {}
+
+        def stage(name, func):
+            result, out[name] = _measure(name, func, memory)
+            results.append(result)
+
+        stage("load_data", t.load_data)
+        stage("set_benchmark", lambda: t.set_benchmark(BENCHMARK))
+        prices, benchmark = out["load_data"], out["set_benchmark"]
+        stage("portfolio_start_balance", lambda: t.portfolio_start_balance(ledger, t.stocks_start))
+        active = out["portfolio_start_balance"]
+        stage("time_fill", lambda: t.time_fill(active))
+        stage("time_fill_long", lambda: t.time_fill(active, long=True))
+        stage("concat_lots", lambda: pd.concat(out["time_fill_long"]))
+        lots = out.pop("concat_lots")
+        del out["time_fill_long"]
+        stage("modified_cost_per_share", lambda: pt.modified_cost_per_share(lots, prices, t.stocks_start))
+        stage("portfolio_end_of_year_stats", lambda: pt.portfolio_end_of_year_stats(lots, prices))
+        stage("portfolio_start_of_year_stats", lambda: pt.portfolio_start_of_year_stats(lots, prices))
+        stage("calc_returns", lambda: pt.calc_returns(lots))
+        stage("benchmark_portfolio_calcs", lambda: pt.benchmark_portfolio_calcs(lots, benchmark))
+        stage("holdings_portfolio_calcs",
+              lambda: pt.holdings_portfolio_calcs(out["time_fill"], benchmark, prices))
+    return [r for r in results if r["stage"] in stages]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--trades", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip memory profiling")
+    parser.add_argument("--output", help="path of the json file of results")
+    args = parser.parse_args()
+
+    results = run(args.symbols, args.trades, args.days, args.seed, args.stages, args.memory)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "params": vars(args), "versions": _versions(), "results": results
+                }, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,8 @@ setup(
     packages=find_packages(include=['surfingcrypto', 'surfingcrypto.*']),
     setup_requires=[],
     tests_require=[],
+    # runtime dependencies (pandas, numpy, pyarrow, coinbase, ...) 
+    # are installed with conda from environment.yml
     install_requires=[],
     extras_require={
         "docs":[
@@ -1,10 +1,379 @@
 import os
 import json
 from coinbase.wallet.client import Client
+import numpy as np
 import pandas as pd
 import time
 import json
 import datetime
+import threading
+import asyncio
+import functools
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from surfingcrypto.transport import RateLimiter, install_transport
+
+#: transaction types whose fees and totals require an additional request
+DETAIL_TYPES=["buy","sell","fiat_withdrawal","fiat_deposit"]
+
+#: transaction types handled by `MyCoinbase`
+KNOWN_TYPES=['buy','sell',"trade","send","fiat_withdrawal","fiat_deposit"]
+
+#: file name of the transaction history persisted in the config folder
+HISTORY_FILE="my_coinbase.parquet"
+
+#: file of the exchange rates stored by `surfingcrypto.coinbase.FxTable`, in the config folder
+FX_FILE="fx_rates.parquet"
+
+
+class DetailCache:
+    """
+    Persistent LRU cache of the (`total`, `subtotal`, `total_fee`) data of 
+    buy, sell, deposit and withdrawal resources, keyed by account and resource id.
+
+    Note:
+        Only completed resources are cached, since their fees and totals 
+        cannot change anymore.
+
+    Arguments:
+        path (str): path of the json file where the cache is persisted.
+        max_size (int): maximum number of entries, least recently used ones are evicted.
+
+    Attributes:
+        hits (int): number of lookups served by the cache.
+        misses (int): number of lookups that required an API call.
+    """
+
+    def __init__(self,path,max_size=100000):
+        self.path=path
+        self.max_size=max_size
+        self.hits=0
+        self.misses=0
+        self._items=OrderedDict()
+        self._lock=threading.Lock()
+        if os.path.isfile(path):
+            with open(path,"r") as f:
+                self._items.update(json.load(f)["items"])
+            self._evict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self,account_id,resource_id):
+        """
+        gets cached data, `None` if missing.
+        """
+        key=account_id+"/"+resource_id
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits+=1
+                return self._items[key]
+            self.misses+=1
+            return None
+
+    def set(self,account_id,resource_id,value):
+        """
+        stores data, evicting the least recently used entries if full.
+        """
+        with self._lock:
+            self._items[account_id+"/"+resource_id]=list(value)
+            self._items.move_to_end(account_id+"/"+resource_id)
+            self._evict()
+
+    def _evict(self):
+        while len(self._items)>self.max_size:
+            self._items.popitem(last=False)
+
+    def dump(self):
+        """
+        persists the cache to its json file.
+        """
+        with self._lock:
+            with open(self.path,"w") as f:
+                json.dump({"items":self._items},f)
+
+
+class HistoryBuffer:
+    """
+    Typed columnar buffer of processed transactions.
+
+    Records are appended column by column (float amounts into `array.array`), 
+    so that no intermediate dict per transaction is kept and the
+    final dataframe is built without type inference.
+    """
+
+    FLOATS=["amount","native_amount","total","subtotal","total_fee","spot_price"]
+    CATEGORIES=["type","symbol","nat_symbol"]
+    OBJECTS=["trade_id","transaction_id"]
+    ORDER=["type","amount","symbol","native_amount","nat_symbol",
+        "total","subtotal","total_fee","spot_price","trade_id","transaction_id"]
+
+    def __init__(self):
+        self.datetime=[]
+        self.columns={c:array("d") for c in self.FLOATS}
+        self.columns.update({c:[] for c in self.CATEGORIES+self.OBJECTS})
+
+    def __len__(self):
+        return len(self.datetime)
+
+    def append(self,record):
+        """
+        appends a processed transaction, `None` floats are stored as NaN.
+        """
+        self.datetime.append(record["datetime"])
+        for c in self.FLOATS:
+            self.columns[c].append(float("nan") if record[c] is None else record[c])
+        for c in self.CATEGORIES+self.OBJECTS:
+            self.columns[c].append(record[c])
+
+    def to_dataframe(self):
+        """
+        builds the transactions dataframe, indexed by UTC datetime.
+
+        Return:
+            df (:obj:`pandas.DataFrame`): typed transactions dataframe
+        """
+        df=pd.DataFrame(
+            {c:pd.array(self.columns[c],dtype=object) for c in self.CATEGORIES+self.OBJECTS},
+            index=pd.DatetimeIndex(pd.to_datetime(self.datetime,utc=True),name="datetime"),
+            )
+        for c in self.FLOATS:
+            df[c]=np.array(self.columns[c],dtype="float64")
+        return set_history_dtypes(df[self.ORDER])
+
+
+def set_history_dtypes(df):
+    """
+    sets compact dtypes of a transactions dataframe: categorical types and symbols,
+    float64 amounts and UTC datetime index.
+    """
+    df=df.copy()
+    df["type"]=df["type"].astype(pd.CategoricalDtype(KNOWN_TYPES))
+    for c in ["symbol","nat_symbol"]:
+        df[c]=df[c].astype("category")
+    for c in HistoryBuffer.FLOATS:
+        df[c]=df[c].astype("float64")
+    df.index=pd.DatetimeIndex(pd.to_datetime(df.index,utc=True),name="datetime")
+    return df
+
+
+class QuoteService:
+    """
+    Spot prices of many currencies from a single request to the exchange 
+    rates endpoint of coinbase API, cached for `ttl` seconds.
+
+    Arguments:
+        client (:obj:`coinbase.wallet.client.Client`): coinbase client.
+        currency (str): currency of the prices.
+        ttl (float): seconds quotes are reused before being requested again.
+
+    Attributes:
+        requests (int): number of requests made to the exchange rates endpoint.
+    """
+
+    def __init__(self,client,currency="EUR",ttl=60):
+        self.client=client
+        self.currency=currency
+        self.ttl=ttl
+        self.requests=0
+        self._rates={}
+        self._updated=None
+        self._lock=threading.Lock()
+
+    def rates(self):
+        """
+        exchange rates of all currencies, units of currency per unit of `currency`,
+        requested if older than `ttl`.
+
+        Return:
+            :obj:`dict`: rates by currency.
+        """
+        with self._lock:
+            if self._updated is None or time.monotonic()-self._updated>=self.ttl:
+                response=self.client.get_exchange_rates(currency=self.currency)
+                self._rates={k:float(v) for k,v in response["rates"].items()}
+                self._updated=time.monotonic()
+                self.requests+=1
+            return self._rates
+
+    def quotes(self,symbols):
+        """
+        spot prices of some currencies.
+
+        Arguments:
+            symbols (:obj:`list` of :obj:`str`): currencies.
+
+        Return:
+            :obj:`pandas.Series`: `spot_price` by `symbol`, `NaN` if not quoted.
+        """
+        rates=self.rates()
+        prices=pd.Series(
+            [1/rates[s] if rates.get(s) else np.nan for s in symbols],
+            index=pd.Index(list(symbols),name="symbol"),
+            name="spot_price",
+            dtype="float64"
+            )
+        return prices
+
+    def quote(self,symbol):
+        """
+        spot price of a currency.
+        """
+        return self.quotes([symbol]).iloc[0]
+
+    def invalidate(self):
+        """
+        forces the next quotes to be requested.
+        """
+        with self._lock:
+            self._updated=None
+
+
+class FxTable:
+    """
+    Historical exchange rates between currencies, stored locally in 
+    `fx_rates.parquet` in the config folder, for converting amounts 
+    between quote currencies without further requests.
+
+    The table has one row of rates per UTC day, refreshed in bulk with a single 
+    request to the exchange rates endpoint, or updated from any other source 
+    of rates. Rates of a row are units of each currency per unit of a common base, 
+    so that the conversion factor from a currency to another is the ratio
+    of their rates.
+
+    Amounts are converted at the last rates available at their date, or 
+    at the first ones if they are older than the table, so that a whole 
+    history is converted with one vectorized multiply.
+
+    Arguments:
+        configuration (:obj:`surfingcrypto.config.config`): configuration object.
+        base (str): base currency of the requested rates.
+
+    Attributes:
+        rates (:obj:`pandas.DataFrame`): rates indexed by UTC `date`, one column 
+            per currency.
+    """
+
+    def __init__(self,configuration,base="EUR"):
+        self.path=configuration.config_folder+"/"+FX_FILE
+        self.base=base
+        if os.path.isfile(self.path):
+            self.rates=pd.read_parquet(self.path)
+        else:
+            self.rates=pd.DataFrame(index=pd.DatetimeIndex([],tz="utc",name="date"),dtype="float64")
+        self._filled=None
+
+    def refresh(self,client,date=None):
+        """
+        stores the current exchange rates of all currencies, 
+        requested at once, as the rates of a day.
+
+        Arguments:
+            client (:obj:`coinbase.wallet.client.Client`): coinbase client.
+            date (str): day of the rates, default today, naive dates
+                are taken as UTC and aware ones converted to UTC.
+        """
+        response=client.get_exchange_rates(currency=self.base)
+        rates={k:float(v) for k,v in response["rates"].items()}
+        rates[self.base]=1.0
+        date=pd.Timestamp.now(tz="utc") if date is None else pd.to_datetime(date,utc=True)
+        self.update(pd.DataFrame([rates],index=pd.DatetimeIndex([date])))
+
+    def update(self,rates):
+        """
+        adds rows of rates to the table, replacing the ones of the same days, 
+        and stores it.
+
+        Arguments:
+            rates (:obj:`pandas.DataFrame`): rates indexed by date, one column per 
+                currency, in units of currency per unit of any base 
+                (the same within a row).
+        """
+        rates=rates.astype("float64")
+        rates.index=pd.DatetimeIndex(pd.to_datetime(rates.index,utc=True)).floor("D").astype("datetime64[ns, UTC]")
+        rates.index.name="date"
+        rates=rates[~rates.index.duplicated(keep="last")]
+        old=self.rates.drop(rates.index,errors="ignore")
+        self.rates=pd.concat([old,rates]).sort_index()
+        self.rates.to_parquet(self.path)
+        self._filled=None
+
+    def factor(self,source,target,dates=None):
+        """
+        conversion factors from currencies to a currency.
+
+        Arguments:
+            source (str or :obj:`list` of :obj:`str`): currency, or currency of each amount.
+            target (str): currency to convert to.
+            dates (:obj:`pandas.DatetimeIndex`): date of each amount, default the last rates.
+
+        Return:
+            :obj:`numpy.ndarray`: units of `target` per unit of `source`, `NaN`
+                if any of them has no rate.
+        """
+        if len(self.rates)==0:
+            raise ValueError("No exchange rates, refresh the table first.")
+        if self._filled is None:
+            self._filled=self.rates.ffill().bfill()
+        currencies=self._filled.columns
+        values=np.column_stack([self._filled.to_numpy(),np.full(len(self._filled),np.nan)])
+        if dates is None:
+            rows=np.full(np.size(source),len(self._filled)-1)
+        else:
+            dates=pd.DatetimeIndex(pd.to_datetime(dates,utc=True)).astype("datetime64[ns, UTC]")
+            known=self._filled.index.astype("datetime64[ns, UTC]")
+            rows=np.searchsorted(known.asi8,dates.asi8,"right")-1
+            rows=np.clip(rows,0,len(self._filled)-1)
+        src=currencies.get_indexer(np.atleast_1d(np.asarray(source,dtype=object)).astype(str))
+        tgt=currencies.get_indexer([target])[0]
+        src[src<0]=len(currencies)
+        tgt=len(currencies) if tgt<0 else tgt
+        return values[rows,tgt]/values[rows,src]
+
+    def convert(self,df,target,columns,source,dates=None):
+        """
+        converts columns of amounts to a currency.
+
+        Arguments:
+            df (:obj:`pandas.DataFrame`): amounts.
+            target (str): currency to convert to.
+            columns (:obj:`list` of :obj:`str`): columns of amounts to convert.
+            source (str): currency of the amounts, or column with the currency of each one.
+            dates (:obj:`pandas.DatetimeIndex`): date of each amount, 
+                eg. `df.index`, default the last rates.
+
+        Return:
+            :obj:`pandas.DataFrame`: copy of `df` with converted amounts.
+        """
+        currencies=df[source].to_numpy() if source in df.columns else np.full(len(df),source)
+        f=self.factor(currencies,target,dates)
+        df=df.copy()
+        columns=[c for c in columns if c in df.columns]
+        df[columns]=df[columns].to_numpy(dtype="float64")*f[:,None]
+        if source in df.columns:
+            categorical=isinstance(df[source].dtype,pd.CategoricalDtype)
+            df[source]=target
+            if categorical:
+                df[source]=df[source].astype("category")
+        return df
+
+
+def read_history(path):
+    """
+    reads a transactions dataframe persisted by `MyCoinbase.save_history`, 
+    without any request to the API.
+
+    Arguments:
+        path (str): path to parquet file.
+
+    Return:
+        df (:obj:`pandas.DataFrame`): typed transactions dataframe
+    """
+    return set_history_dtypes(pd.read_parquet(path))
+
 
 class CB:
 
@@ -31,36 +400,77 @@ class CB:
 
     Arguments:
 		configuration (:obj:`surfingcrypto.config.config`): package configuration object
+        transport (:obj:`surfingcrypto.transport.TransportSession`): HTTP transport 
+            used by the client, default a new one with coinbase rate limits.
 
     Attributes: 
+        config (:obj:`surfingcrypto.config.config`): package configuration object
         client (:obj:`coinbase.wallet.client.Client`): client object for making requests to coinbase API
+        transport (:obj:`surfingcrypto.transport.TransportSession`): pooled, rate limited 
+            HTTP transport of the client, with per-endpoint metrics.
         user (:obj:`coinbase API object`): user API object
     """
 
-    def __init__(self,configuration):
+    def __init__(self,configuration,transport=None):
 
+        self.config=configuration
         if "coinbase" in configuration.config:
             credentials=configuration.config["coinbase"]
             self.client = Client(credentials["key"],credentials["scrt"])
+            if hasattr(self.client,"session"):
+                self.transport=install_transport(self.client,transport)
+            else:
+                self.transport=None
             self.user=self.client.get_current_user()
         else:
             raise ValueError("config.json file must contain a coinbase token.")
 
-    def _get_paginated_items(self,api_method, limit=100):
+    def _get_paginated_items(self,api_method, limit=100, starting_after=None, **params):
         """Generic getter for paginated items
         - https://stackoverflow.com/questions/44351034/pagination-on-coinbase-python-api
+
+        Arguments:
+            starting_after (str): id of the item after which to start listing.
+            **params: additional query parameters of the API method, eg. `order`.
+        """
+        return list(self._iter_paginated_items(api_method, limit, starting_after, **params))
+
+    def _iter_paginated_items(self,api_method, limit=100, starting_after=None, prefetch=False, **params):
+        """Lazy generic getter for paginated items, yields items page by page.
+
+        Pages are requested only when the previous one has been consumed, 
+        so that callers can stop early without fetching the remaining pages.
+
+        Arguments:
+            starting_after (str): id of the item after which to start listing.
+            prefetch (bool): request the next page in a background thread 
+                while the items of the current one are being consumed.
+            **params: additional query parameters of the API method, eg. `order`.
         """
-        all_items = []
-        starting_after = None
-        while True:
-            items = api_method(limit=limit, starting_after=starting_after)
-            if items.pagination.next_starting_after is not None:
+        executor=ThreadPoolExecutor(max_workers=1) if prefetch else None
+        future=None
+        try:
+            items = api_method(limit=limit, starting_after=starting_after, **params)
+            while True:
                 starting_after = items.pagination.next_starting_after
-                all_items += items.data
-            else:
-                all_items += items.data
-                break
-        return all_items
+                if starting_after is not None and prefetch:
+                    future=executor.submit(
+                        api_method, limit=limit, starting_after=starting_after, **params
+                        )
+                for item in items.data:
+                    yield item
+                if starting_after is None:
+                    break
+                if prefetch:
+                    items=future.result()
+                    future=None
+                else:
+                    items = api_method(limit=limit, starting_after=starting_after, **params)
+        finally:
+            if executor is not None:
+                if future is not None:
+                    future.cancel()
+                executor.shutdown(wait=False)
 
     def get_accounts(self, limit=100):
         """
@@ -77,6 +487,29 @@ class CB:
         """
         return self._get_paginated_items(account.get_transactions, limit)
 
+    def iter_transactions(self,account, limit=100, prefetch=True):
+        """
+        lazily iterate over all transactions from specified account, page by page.
+        
+        Arguments
+            account (:obj:`coinbase.wallet.model.ApiObject`) : coinbase account object.
+            prefetch (bool) : download the next page while the current one is processed.
+        """
+        return self._iter_paginated_items(account.get_transactions, limit, prefetch=prefetch)
+
+    def get_new_transactions(self,account,cursor,limit=100):
+        """
+        get transactions from specified account created after a known transaction,
+        oldest first.
+
+        Arguments
+            account (:obj:`coinbase.wallet.model.ApiObject`) : coinbase account object.
+            cursor (str) : id of the newest already known transaction.
+        """
+        return self._get_paginated_items(
+            account.get_transactions, limit, starting_after=cursor, order="asc"
+            )
+
     def get_active_accounts(self):
         """
         get active accounts (balance > 0)
@@ -91,55 +524,176 @@ class CB:
                 active.append(account)
         return active
 
-    def get_all_accounts_with_transactions(self,verbose=False):
+    def get_all_accounts_with_transactions(
+            self,
+            verbose=False,
+            max_workers=1,
+            requests_per_second=None,
+            callback=None,
+            probe=False
+        ):
         """
         get all accounts with recorded transactions.
         
         Note:
-            SUPER FUCKING SLOW!!!
+            SUPER FUCKING SLOW in sequential mode (`max_workers=1`)!!!
+            With `max_workers>1` accounts are scanned concurrently by a bounded
+            thread pool, sharing the rate limited `transport` of the client.
+            With `probe=True` only the newest and the oldest transaction of each 
+            account are requested, at most two calls per account.
 
         Params:
-            verbose (bool): verbose mode in order to check status
+            verbose (bool): verbose mode in order to check status, prints progress
+                if no `callback` is given.
+            max_workers (int): number of accounts fetched at the same time.
+            requests_per_second (float): additional limit to the rate of paginated 
+                requests in concurrent mode, default `None`.
+            callback (callable): called as `callback(done,total,account)` 
+                every time an account has been scanned.
+            probe (bool): get time ranges by probing first and last transaction
+                instead of downloading all of them.
         
         Return:
             has_transactions (:obj:`list` of :obj:`coinbase.ApiObject`): list of coinbase accounts
             timeranges (:obj:`list` of :obj:`dict`): list of dictionaries with dates of first 
             and last transaction for each account in `has_transactions`
         """
-        has_transactions=[]
-        timeranges=[]
         accounts=self.get_accounts()
         l=len(accounts)
-        for account,i in zip(accounts,range(l)):
-            if verbose:
-                print(f"## {i+1} of {l}")
-                print(account["currency"])
-            transactions=self.get_transactions(account)
-            if len(transactions) > 0:
-                timerange={
-                    0:transactions[0]["created_at"],
-                    1:transactions[-1]["created_at"]
-                }
+        if callback is None and verbose:
+            callback=_print_progress
+
+        if max_workers>1:
+            limiter=None if requests_per_second is None else RateLimiter(requests_per_second)
+            lock=threading.Lock()
+            done=[0]
+
+            def scan(account):
+                timerange=self._scan_timerange(
+                    _throttled(account.get_transactions,limiter),probe
+                    )
+                if callback is not None:
+                    with lock:
+                        done[0]+=1
+                        callback(done[0],l,account)
+                return timerange
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                #map preserves the order of accounts
+                all_timeranges=list(executor.map(scan,accounts))
+        else:
+            all_timeranges=[]
+            for account,i in zip(accounts,range(l)):
+                all_timeranges.append(self._scan_timerange(account.get_transactions,probe))
+                if callback is not None:
+                    callback(i+1,l,account)
+
+        has_transactions=[]
+        timeranges=[]
+        for account,timerange in zip(accounts,all_timeranges):
+            if timerange is not None:
                 has_transactions.append(account)
                 timeranges.append(timerange)
         return has_transactions,timeranges
 
-    def get_accounts_from_list(self,l=None):
+    def _scan_timerange(self,api_method,probe=False):
+        """
+        time range of the transactions listed by `api_method`, either probed
+        or from the full list.
+        """
+        if probe:
+            return self._probe_timerange(api_method)
+        return self._timerange(self._get_paginated_items(api_method))
+
+    def probe_timerange(self,account):
+        """
+        gets dates of last (`0`) and first (`1`) transaction of specified account
+        with two single-item requests, `None` if there are no transactions.
+
+        Arguments
+            account (:obj:`coinbase.wallet.model.ApiObject`) : coinbase account object.
+        """
+        return self._probe_timerange(account.get_transactions)
+
+    def _probe_timerange(self,api_method):
+        newest=api_method(limit=1).data
+        if len(newest)==0:
+            return None
+        oldest=api_method(limit=1,order="asc").data
+        return {
+            0:newest[0]["created_at"],
+            1:oldest[0]["created_at"]
+        }
+
+    def _timerange(self,transactions):
+        """
+        dates of last (`0`) and first (`1`) transaction of a newest-first list,
+        `None` if the list is empty.
+        """
+        if len(transactions) > 0:
+            return {
+                0:transactions[0]["created_at"],
+                1:transactions[-1]["created_at"]
+            }
+        return None
+
+    def get_accounts_from_list(self,l=None,strategy="auto",max_workers=8):
         """
         gets accounts from a list dumped locally in the config folder.
 
+        Accounts are resolved in bulk, either with one paginated sweep of all 
+        accounts filtered by id (`sweep`), or with concurrent single lookups 
+        (`concurrent`). In `auto` mode, concurrent lookups are used when they fit 
+        in a single round of the thread pool, otherwise the sweep 
+        costs less requests.
+
+        Arguments:
+            l (:obj:`list` of :obj:`dict`): accounts as dumped in `coinbase_accounts.json`.
+            strategy (str): `auto`, `sweep` or `concurrent`.
+            max_workers (int): threads used by concurrent lookups.
+
         Return:
             from_list (:obj:`list` of :obj:`coinbase.ApiObject`): list of coinbase accounts
         """
-        if isinstance(l,list):
-            from_list=[]
-            for account in l:
-                from_list.append(self.client.get_account(account["account_id"]))
-        else:
+        if not isinstance(l,list):
             raise ValueError("Must be a list.")
+        ids=[account["account_id"] for account in l]
+        if strategy=="auto":
+            strategy="concurrent" if len(ids)<=max_workers else "sweep"
+
+        if strategy=="sweep":
+            by_id={account["id"]:account for account in self.get_accounts()}
+            #accounts missing from the sweep are looked up one by one
+            from_list=[
+                by_id[i] if i in by_id else self.client.get_account(i) for i in ids
+            ]
+        elif strategy=="concurrent":
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                from_list=list(executor.map(self.client.get_account,ids))
+        else:
+            raise ValueError("Strategy not implemented.")
         return from_list
 
 
+def _throttled(api_method,limiter):
+    """
+    wraps an API method so that every call waits for a `RateLimiter` token.
+    """
+    if limiter is None:
+        return api_method
+    def wrapper(*args,**kwargs):
+        limiter.acquire()
+        return api_method(*args,**kwargs)
+    return wrapper
+
+def _print_progress(done,total,account):
+    """
+    default progress callback of `CB.get_all_accounts_with_transactions`.
+    """
+    print(f"## {done} of {total}")
+    print(account["currency"])
+
+
 class MyCoinbase(CB):
     """
     This class is the user's portfolio.
@@ -154,8 +708,14 @@ class MyCoinbase(CB):
         accounts (:obj:`list` of :obj:`coibase.model.ApiObject`): list of selected accounts.
         timeranges (:obj:`list` of :obj:`dict`): list of dictionaries with dates of first and last transaction for each account
         isHistoric (bool): if module has been loaded in historic mode.
-        my_coinbase (:obj:`pandas.DataFrame`): dataframe of all user's transactions.
-        my_coinbase_obj (:obj:`list` of :obj:`coibase.model.ApiObject`): list of processed transactions.
+        my_coinbase (:obj:`pandas.DataFrame`): dataframe of all user's transactions,
+            with categorical types and symbols and UTC datetime index.
+        cursors (:obj:`dict` of :obj:`dict`): id and `created_at` of newest known transaction 
+            of each account, only in incremental mode.
+        detail_cache (:obj:`surfingcrypto.coinbase.DetailCache`): cache of transactions 
+            additional data, only if `history` has been called with `cache=True`.
+        my_coinbase_obj (:obj:`list` of :obj:`coibase.model.ApiObject`): list of processed transactions,
+            `None` unless `history` has been called with `keep_objects=True`.
         unhandled_trans (:obj:`list` of :obj:`dict`): list informations of unhandled transactions.
         error_log (:obj:`list` of :obj:`dict`): list informations of transactions that resulted in an error.
     """
@@ -186,7 +746,7 @@ class MyCoinbase(CB):
                 accounts,last_updated=self.load_accounts()
                 self.accounts=self.get_accounts_from_list(accounts)
             else:
-                self.accounts,self.timeranges=self.get_all_accounts_with_transactions()
+                self.accounts,self.timeranges=self.get_all_accounts_with_transactions(probe=True)
                 self.dump_accounts()
         else:
             raise ValueError("Either true or false.") 
@@ -220,65 +780,203 @@ class MyCoinbase(CB):
             last_updated=dict["datetime"]
         return accounts,last_updated
 
-    def mycoinbase_report(self):
+    def mycoinbase_report(self,currency="EUR",fx=None):
         """
-        nicely formatted report of accounts portfolio and user's total balance in EUR
+        nicely formatted report of accounts portfolio and user's total balance
+
+        Arguments:
+            currency (str): currency of the total balance.
+            fx (:obj:`surfingcrypto.coinbase.FxTable`): exchange rates, needed 
+                if `currency` is not the native currency of the accounts.
         
         Returns:
             s (str): text
         """
         s=""
-        tot=0
         if hasattr(self,"accounts"):
+            amounts,currencies=[],[]
             for account in self.accounts:
                 if float(account.native_balance.amount)>0:
                     s=s+str(account.currency)+" : "+str(account.native_balance)+"\n"
-                    tot+=float(account.native_balance.amount)
-            s=s+"---\n"+"Portfolio: EUR "+"{:.2f}".format(tot)
+                    amounts.append(float(account.native_balance.amount))
+                    currencies.append(account.native_balance.currency)
+            amounts=np.array(amounts,dtype="float64")
+            if fx is not None:
+                amounts=amounts*fx.factor(currencies,currency)
+            elif any(c!=currency for c in currencies):
+                raise ValueError("Exchange rates needed for a total in "+currency+".")
+            s=s+"---\n"+"Portfolio: "+currency+" "+"{:.2f}".format(amounts.sum())
             return s
         else:
             raise   ValueError("Must get accounts first.")
     
-    def history(self):
+    def history(self,incremental=False,cache=False,cache_size=100000,keep_objects=False):
         """
         gets all transactions info and sets a pandas df.
+
+        In incremental mode, only transactions newer than the cursors stored 
+        in `coinbase_cursors.json` are downloaded and merged into the 
+        transactions persisted in `my_coinbase.parquet`, both in the config folder.
+        Cursors of accounts whose transactions raised errors are not advanced, 
+        so that these are retried in the following session.
+
+        With `cache=True` the additional data of buys, sells, deposits and withdrawals 
+        is stored in `coinbase_details.json` in the config folder, so that following
+        sessions do not need to request it again.
+
+        Arguments:
+            incremental (bool): default `False`, sync only new transactions.
+            cache (bool): default `False`, use the persistent `DetailCache`.
+            cache_size (int): maximum number of entries of the cache.
+            keep_objects (bool): default `False`, keep the raw API objects 
+                of processed transactions in `my_coinbase_obj`.
         """
         if self.isHistoric is True:
-            ### ci sonotanti tipi di transactions
-            self.unhandled_trans=[]
-            #error log for when failing handling known transactions types
-            self.error_log=[]
-
-            self.my_coinbase = []
-            self.my_coinbase_obj=[]
             if hasattr(self,"accounts"):
-                for account in self.accounts:
-                    self.handle_transactions(account)
-                self.my_coinbase=pd.DataFrame(self.my_coinbase).set_index("datetime")
-                order=["type","amount","symbol","native_amount","nat_symbol"]
-                neworder=order + [c for c in self.my_coinbase.columns if c not in order]
-                self.my_coinbase=self.my_coinbase.reindex(columns=neworder)
+                if cache and not hasattr(self,"detail_cache"):
+                    self.detail_cache=DetailCache(
+                        self.config.config_folder+"/coinbase_details.json",cache_size
+                        )
+                if incremental:
+                    self.cursors=self.load_cursors()
+
+                def handle(account):
+                    if incremental and account["id"] in self.cursors:
+                        transactions=self.get_new_transactions(
+                            account,self.cursors[account["id"]]["id"]
+                            )
+                    elif incremental:
+                        transactions=self.get_transactions(account)
+                    else:
+                        #streamed page by page
+                        transactions=None
+                    errors=len(self.error_log)
+                    self.handle_transactions(account,transactions)
+                    if incremental and len(transactions)>0 and len(self.error_log)==errors:
+                        newest=max(transactions,key=lambda t:t["created_at"])
+                        self.cursors[account["id"]]={
+                            "id":newest["id"],
+                            "created_at":newest["created_at"]
+                        }
+
+                self.build_history(handle,keep_objects)
+                if incremental:
+                    self.merge_history()
+                    self.dump_cursors()
+                if cache:
+                    self.detail_cache.dump()
             else:
                 raise   ValueError("Must get accounts first.")
-
-            if len(self.unhandled_trans)>0:
-                print(f"Warning! There are {len(self.unhandled_trans)} unknown transaction types and therefore they have been skipped.")
-            if len(self.error_log)>0:
-                print(f"Warning! There were {len(self.error_log)} errors during the handling of transactions.")
         else:
             raise ValueError("Must load historic data.")
-        
 
-    def handle_transactions(self, account):
+    def build_history(self,handle,keep_objects=False):
+        """
+        builds the `my_coinbase` dataframe, handling the transactions
+        of each account with `handle(account)`, and warns about unknown
+        transaction types and errors.
+
+        Arguments:
+            handle (callable): handles the transactions of an account, 
+                eg. with `handle_transactions`.
+            keep_objects (bool): default `False`, keep the raw API objects 
+                of processed transactions in `my_coinbase_obj`.
+        """
+        ### ci sonotanti tipi di transactions
+        self.unhandled_trans=[]
+        #error log for when failing handling known transactions types
+        self.error_log=[]
+
+        self.my_coinbase = HistoryBuffer()
+        self.my_coinbase_obj=[] if keep_objects else None
+        for account in self.accounts:
+            handle(account)
+        self.my_coinbase=self.my_coinbase.to_dataframe()
+
+        if len(self.unhandled_trans)>0:
+            print(f"Warning! There are {len(self.unhandled_trans)} unknown transaction types and therefore they have been skipped.")
+        if len(self.error_log)>0:
+            print(f"Warning! There were {len(self.error_log)} errors during the handling of transactions.")
+
+    def merge_history(self):
+        """
+        merges newly fetched transactions with the ones persisted in `my_coinbase.parquet`
+        and persists the result.
+        """
+        path=self.config.config_folder+"/"+HISTORY_FILE
+        if os.path.isfile(path):
+            stored=read_history(path)
+            merged=pd.concat([stored,self.my_coinbase]) if len(self.my_coinbase)>0 else stored
+            merged=merged[~merged["transaction_id"].duplicated(keep="last")]
+            self.my_coinbase=set_history_dtypes(merged)
+        self.save_history()
+
+    def save_history(self,path=None):
+        """
+        persists `my_coinbase` in parquet format, by default to `my_coinbase.parquet` 
+        in the config folder.
+
+        Arguments:
+            path (str): path to parquet file.
+        """
+        if path is None:
+            path=self.config.config_folder+"/"+HISTORY_FILE
+        self.my_coinbase.to_parquet(path)
+
+    def load_history(self,path=None):
+        """
+        loads `my_coinbase` persisted by `save_history`.
+
+        Arguments:
+            path (str): path to parquet file.
+        """
+        if path is None:
+            path=self.config.config_folder+"/"+HISTORY_FILE
+        self.my_coinbase=read_history(path)
+        return self.my_coinbase
+
+    def load_cursors(self):
+        """
+        load per-account cursors from `coinbase_cursors.json` file.
+        """
+        path=self.config.config_folder+"/coinbase_cursors.json"
+        if os.path.isfile(path):
+            with open(path,"r") as f:
+                return json.load(f)["cursors"]
+        return {}
+
+    def dump_cursors(self):
+        """
+        dumps per-account cursors to `coinbase_cursors.json` file.
+        """
+        dump={
+            "datetime":datetime.datetime.today().strftime("%d-%m-%y"),
+            "cursors":self.cursors
+        }
+        with open(self.config.config_folder+"/coinbase_cursors.json","w") as f:
+            json.dump(dump,f,indent=4)
+
+    def handle_transactions(self, account, transactions=None, details=None):
         """
         handles the transactions based on type.
+
+        Arguments:
+            account (:obj:`coinbase.wallet.model.ApiObject`) : coinbase account object.
+            transactions (:obj:`list` of :obj:`coinbase.wallet.model.ApiObject`) : transactions
+                to handle, default all transactions of the account, 
+                processed while the following page is downloaded.
+            details (dict) : already fetched `get_transact_data` results (or errors)
+                by transaction id.
         """
-        self.known_types=['buy','sell',"trade","send","fiat_withdrawal","fiat_deposit"]
-        for transaction in self.get_transactions(account):
+        self.known_types=KNOWN_TYPES
+        if transactions is None:
+            transactions=self.iter_transactions(account)
+        for transaction in transactions:
             try:
                 if transaction['type'] in self.known_types:
-                    self.process_transaction(account,transaction)
-                    self.my_coinbase_obj.append(transaction)
+                    self.process_transaction(account,transaction,details)
+                    if self.my_coinbase_obj is not None:
+                        self.my_coinbase_obj.append(transaction)
                 else:
                     self.unhandled_trans.append(
                         {   
@@ -297,14 +995,23 @@ class MyCoinbase(CB):
                             "error_log":e,
                         })                        
     
-    def process_transaction(self,account,transaction):
+    def process_transaction(self,account,transaction,details=None):
         """
         process a transaction.
+
+        Arguments:
+            details (dict) : already fetched `get_transact_data` results (or errors)
+                by transaction id.
         """
         # spot price??
         symbol, amount, datetime = self.get_transact_info(transaction)
         nat_amount,nat_symbol=self.get_native_amount(transaction)
-        total, subtotal, total_fee  = self.get_transact_data(account, transaction)
+        if details is not None and transaction["id"] in details:
+            if isinstance(details[transaction["id"]],Exception):
+                raise details[transaction["id"]]
+            total, subtotal, total_fee = details[transaction["id"]]
+        else:
+            total, subtotal, total_fee  = self.get_transact_data(account, transaction)
         
         if subtotal is None:
             spot_price=nat_amount/amount
@@ -327,7 +1034,8 @@ class MyCoinbase(CB):
             'subtotal': subtotal,
             'total_fee': total_fee,
             "spot_price":abs(spot_price),
-            "trade_id":trade_id
+            "trade_id":trade_id,
+            "transaction_id":transaction["id"],
             })
 
     def get_transact_info(self, transaction):
@@ -350,7 +1058,18 @@ class MyCoinbase(CB):
     def get_transact_data(self,account,transaction):
         """
         gets required additional data (eg. fees) from different kinds of transactions.
+
+        Note:
+            if a `detail_cache` is set, data of completed resources is looked up 
+            there before calling the API.
         """
+        cache=getattr(self,"detail_cache",None)
+        if cache is not None and transaction["type"] in DETAIL_TYPES:
+            resource_id=transaction[transaction["type"]]["id"]
+            cached=cache.get(account["id"],resource_id)
+            if cached is not None:
+                return tuple(cached)
+
         if transaction["type"]=="sell":
             t = self.client.get_sell(account["id"],transaction['sell']['id'])
         elif transaction["type"]=="buy":
@@ -375,6 +1094,133 @@ class MyCoinbase(CB):
             if "fees" in t:
                 for fee in t['fees']:
                     total_fee += float(fee['amount']['amount'])
+            if cache is not None and t.get("status","completed")=="completed":
+                cache.set(account["id"],resource_id,(total,subtotal,total_fee))
         else:
             total,subtotal,total_fee= None,None,None
         return total,subtotal,total_fee
+
+
+class AsyncMyCoinbase:
+    """
+    Asyncio counterpart of `surfingcrypto.coinbase.MyCoinbase`.
+
+    Requests are made by a `MyCoinbase` object in a bounded thread pool,
+    sharing its pooled and rate limited transport, so that many of them 
+    overlap while awaited in the event loop.
+    Attributes of the wrapped `MyCoinbase` (eg. `accounts`, `my_coinbase`,
+    `error_log`) are accessible directly.
+
+    Note:
+        Create it with `await AsyncMyCoinbase.create(...)`, 
+        that does not block the event loop.
+
+    Arguments:
+        mycoinbase (:obj:`surfingcrypto.coinbase.MyCoinbase`): started portfolio object.
+        max_concurrency (int): maximum number of concurrent requests.
+        executor (:obj:`concurrent.futures.ThreadPoolExecutor`): thread pool, 
+            default a new one with `max_concurrency` workers.
+
+    Attributes:
+        sync (:obj:`surfingcrypto.coinbase.MyCoinbase`): wrapped portfolio object.
+    """
+
+    def __init__(self,mycoinbase,max_concurrency=8,executor=None):
+        self.sync=mycoinbase
+        self.max_concurrency=max_concurrency
+        if executor is None:
+            executor=ThreadPoolExecutor(max_workers=max_concurrency)
+        self.executor=executor
+
+    @classmethod
+    async def create(cls,*args,max_concurrency=8,**kwargs):
+        """
+        creates and starts the wrapped `MyCoinbase` in the thread pool.
+
+        Arguments:
+            max_concurrency (int): maximum number of concurrent requests.
+            *args,**kwargs : arguments of `MyCoinbase`.
+        """
+        executor=ThreadPoolExecutor(max_workers=max_concurrency)
+        mycoinbase=await asyncio.get_running_loop().run_in_executor(
+            executor,functools.partial(MyCoinbase,*args,**kwargs)
+            )
+        return cls(mycoinbase,max_concurrency,executor)
+
+    def __getattr__(self,name):
+        if name=="sync":
+            raise AttributeError(name)
+        return getattr(self.sync,name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc):
+        self.close()
+
+    def close(self):
+        """
+        shuts down the thread pool.
+        """
+        self.executor.shutdown(wait=False)
+
+    async def _run(self,func,*args,**kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,functools.partial(func,*args,**kwargs)
+            )
+
+    async def get_accounts(self):
+        """
+        awaitable `MyCoinbase.get_accounts`.
+        """
+        return await self._run(self.sync.get_accounts)
+
+    async def get_transactions(self,account,limit=100):
+        """
+        awaitable `MyCoinbase.get_transactions`.
+        """
+        return await self._run(self.sync.get_transactions,account,limit)
+
+    async def get_transact_data(self,account,transaction):
+        """
+        awaitable `MyCoinbase.get_transact_data`.
+        """
+        return await self._run(self.sync.get_transact_data,account,transaction)
+
+    async def history(self,keep_objects=False):
+        """
+        awaitable `MyCoinbase.history`, sets the same `my_coinbase` dataframe.
+
+        Transactions of all accounts are fetched concurrently, then 
+        the additional data of all buys, sells, deposits and withdrawals.
+
+        Arguments:
+            keep_objects (bool): default `False`, keep the raw API objects 
+                of processed transactions in `my_coinbase_obj`.
+        """
+        if self.sync.isHistoric is not True:
+            raise ValueError("Must load historic data.")
+        if not hasattr(self.sync,"accounts"):
+            raise ValueError("Must get accounts first.")
+        accounts=self.sync.accounts
+        all_transactions=await asyncio.gather(
+            *[self.get_transactions(account) for account in accounts]
+            )
+        pending=[
+            (account,transaction)
+            for account,transactions in zip(accounts,all_transactions)
+            for transaction in transactions
+            if transaction["type"] in DETAIL_TYPES
+        ]
+        results=await asyncio.gather(
+            *[self.get_transact_data(account,transaction) for account,transaction in pending],
+            return_exceptions=True
+            )
+        details={transaction["id"]:result for (_,transaction),result in zip(pending,results)}
+        by_account={account["id"]:transactions for account,transactions in zip(accounts,all_transactions)}
+
+        def handle(account):
+            self.sync.handle_transactions(account,by_account[account["id"]],details)
+
+        await self._run(self.sync.build_history,handle,keep_objects)
+        return self.sync.my_coinbase
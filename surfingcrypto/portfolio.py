@@ -1,11 +1,238 @@
+import numpy as np
 import pandas as pd
 
+from surfingcrypto.coinbase import QuoteService
+from surfingcrypto.portfolio_tracker import read_closes
+
+#: fields aggregated by :obj:`TransactionIndex`
+INDEX_FIELDS=["amount","native_amount","total_fee"]
+
+#: columns of amounts in the native currency of the account
+NATIVE_COLUMNS=["native_amount","total","subtotal","total_fee","spot_price"]
+
+#: transaction types that change the balance of a currency
+BALANCE_TYPES=["buy","sell","trade","send"]
+
+
+class TransactionIndex:
+    """
+    Sorted index of coinbase transactions, for repeated range and group queries.
+
+    Transactions are sorted by datetime once and grouped by `symbol` and `type`.
+    Each group keeps the datetimes of its transactions and the prefix sums of 
+    their :data:`INDEX_FIELDS`, so that the total of a field over a datetime range 
+    costs two binary searches per group, and selecting `k` transactions
+    costs O(log n + k).
+
+    New transactions are added with :meth:`append`: prefix sums are 
+    extended with the new ones only, unless they are older than the
+    indexed ones, in which case the index is rebuilt.
+
+    Arguments:
+        df (:obj:`pandas.DataFrame`): coinbase transaction history 
+            indexed by datetime, eg. `surfingcrypto.coinbase.MyCoinbase.df`
+
+    Attributes:
+        df (:obj:`pandas.DataFrame`): transactions sorted by datetime.
+        groups (:obj:`dict`): `pos` (positions in `df`), `times` (ns) and 
+            `prefix` sums of each `(symbol,type)` group.
+    """
+
+    def __init__(self,df):
+        self.df=df.iloc[:0]
+        self.groups={}
+        self.times=np.empty(0,dtype="int64")
+        self.append(df)
+
+    def __len__(self):
+        return len(self.df)
+
+    @staticmethod
+    def _times(index):
+        return pd.DatetimeIndex(pd.to_datetime(index,utc=True)).astype("datetime64[ns, UTC]").asi8
+
+    @staticmethod
+    def _bound(date,default):
+        return default if date is None else _to_utc(date).value
+
+    def append(self,df):
+        """
+        adds transactions to the index.
+
+        Arguments:
+            df (:obj:`pandas.DataFrame`): new transactions.
+        """
+        times=self._times(df.index)
+        order=np.argsort(times,kind="stable")
+        if len(self.times)>0 and len(times)>0 and times[order[0]]<self.times[-1]:
+            data=pd.concat([self.df,df])
+            self.df=data.iloc[:0]
+            self.groups={}
+            self.times=np.empty(0,dtype="int64")
+            return self.append(data)
+        df=df.iloc[order]
+        times=times[order]
+        offset=len(self.df)
+        self.df=pd.concat([self.df,df]) if offset>0 else df
+        self.times=np.concatenate([self.times,times])
+
+        values=np.nan_to_num(df[INDEX_FIELDS].to_numpy(dtype="float64"))
+        keys=pd.MultiIndex.from_arrays([df["symbol"].astype(str),df["type"].astype(str)])
+        codes,uniques=pd.factorize(keys)
+        for code,key in enumerate(uniques):
+            pos=np.flatnonzero(codes==code)
+            g=self.groups.get(key)
+            if g is None:
+                g=self.groups[key]={
+                    "pos":np.empty(0,dtype="int64"),
+                    "times":np.empty(0,dtype="int64"),
+                    "prefix":np.zeros((1,len(INDEX_FIELDS))),
+                    }
+            g["pos"]=np.concatenate([g["pos"],pos+offset])
+            g["times"]=np.concatenate([g["times"],times[pos]])
+            g["prefix"]=np.concatenate([g["prefix"],g["prefix"][-1]+np.cumsum(values[pos],axis=0)])
+
+    def _keys(self,symbol=None,type=None):
+        symbols=None if symbol is None else set(np.atleast_1d(symbol))
+        types=None if type is None else set(np.atleast_1d(type))
+        return [
+            k for k in self.groups
+            if (symbols is None or k[0] in symbols) and (types is None or k[1] in types)
+            ]
+
+    def _range(self,times,start,end):
+        return (
+            np.searchsorted(times,self._bound(start,np.iinfo("int64").min),"left"),
+            np.searchsorted(times,self._bound(end,np.iinfo("int64").max),"right"),
+            )
+
+    def select(self,start=None,end=None,symbol=None,type=None):
+        """
+        transactions in a datetime range, `start` and `end` included.
+
+        Arguments:
+            start (str): first datetime.
+            end (str): last datetime.
+            symbol (str or :obj:`list` of :obj:`str`): symbols, default all.
+            type (str or :obj:`list` of :obj:`str`): transaction types, default all.
+
+        Return:
+            :obj:`pandas.DataFrame`: transactions sorted by datetime.
+        """
+        if symbol is None and type is None:
+            i,j=self._range(self.times,start,end)
+            return self.df.iloc[i:j]
+        pos=[]
+        for key in self._keys(symbol,type):
+            g=self.groups[key]
+            i,j=self._range(g["times"],start,end)
+            pos.append(g["pos"][i:j])
+        pos=np.sort(np.concatenate(pos)) if pos else np.empty(0,dtype="int64")
+        return self.df.iloc[pos]
+
+    def total(self,field,start=None,end=None,symbol=None,type=None):
+        """
+        total of a field over a datetime range, `start` and `end` included.
+
+        Arguments:
+            field (str): one of :data:`INDEX_FIELDS`.
+            start (str): first datetime.
+            end (str): last datetime.
+            symbol (str or :obj:`list` of :obj:`str`): symbols, default all.
+            type (str or :obj:`list` of :obj:`str`): transaction types, default all.
+
+        Return:
+            float: total.
+        """
+        f=INDEX_FIELDS.index(field)
+        total=0.0
+        for key in self._keys(symbol,type):
+            g=self.groups[key]
+            i,j=self._range(g["times"],start,end)
+            total+=g["prefix"][j,f]-g["prefix"][i,f]
+        return total
+
+    def totals(self,field,by="type",start=None,end=None,symbol=None,type=None):
+        """
+        totals of a field by `symbol` or `type` over a datetime range.
+
+        Arguments:
+            field (str): one of :data:`INDEX_FIELDS`.
+            by (str): `symbol` or `type`.
+            start (str): first datetime.
+            end (str): last datetime.
+            symbol (str or :obj:`list` of :obj:`str`): symbols, default all.
+            type (str or :obj:`list` of :obj:`str`): transaction types, default all.
+
+        Return:
+            :obj:`pandas.Series`: totals indexed by `by`, sorted.
+        """
+        if by not in ["symbol","type"]:
+            raise ValueError("Totals can only be grouped by symbol or type.")
+        f=INDEX_FIELDS.index(field)
+        totals={}
+        for key in self._keys(symbol,type):
+            g=self.groups[key]
+            i,j=self._range(g["times"],start,end)
+            k=key[0] if by=="symbol" else key[1]
+            totals[k]=totals.get(k,0.0)+g["prefix"][j,f]-g["prefix"][i,f]
+        totals=pd.Series(totals,name=field,dtype="float64").sort_index()
+        totals.index.name=by
+        return totals
+
+    def resample(self,field,freq="MS",start=None,end=None,symbol=None,type=None):
+        """
+        totals of a field by period, eg. fees by month.
+
+        Arguments:
+            field (str): one of :data:`INDEX_FIELDS`.
+            freq (str): frequency of the periods, eg. `MS`, `W-MON` or `1D`.
+            start (str): first datetime, default the first transaction.
+            end (str): last datetime, default the last transaction.
+            symbol (str or :obj:`list` of :obj:`str`): symbols, default all.
+            type (str or :obj:`list` of :obj:`str`): transaction types, default all.
+
+        Return:
+            :obj:`pandas.Series`: totals indexed by the start of each period.
+        """
+        f=INDEX_FIELDS.index(field)
+        if len(self.times)==0:
+            return pd.Series(dtype="float64",name=field)
+        offset=pd.tseries.frequencies.to_offset(freq)
+        first=pd.Timestamp(self._bound(start,self.times[0])).tz_localize("utc")
+        last=pd.Timestamp(self._bound(end,self.times[-1])).tz_localize("utc")
+        edges=pd.date_range(offset.rollback(first.normalize()),last+offset,freq=offset)
+        bounds=edges.astype("datetime64[ns, UTC]").asi8.copy()
+        bounds[0]=max(bounds[0],first.value)
+        totals=np.zeros(len(edges)-1)
+        for key in self._keys(symbol,type):
+            g=self.groups[key]
+            cum=g["prefix"][np.searchsorted(g["times"],bounds,"left"),f]
+            cum[-1]=g["prefix"][np.searchsorted(g["times"],last.value,"right"),f]
+            totals+=np.diff(cum)
+        return pd.Series(totals,index=pd.DatetimeIndex(edges[:-1],name="datetime"),name=field)
+
+    def balance(self,date=None):
+        """
+        balance of each currency at a datetime.
+
+        Arguments:
+            date (str): datetime, default after all transactions.
+
+        Return:
+            :obj:`pandas.Series`: `amount` by `symbol`.
+        """
+        return self.totals("amount","symbol",end=date,type=BALANCE_TYPES)
+
+
 class PortfolioAnalysis:
     """
     This class is a Coinbase portfolio analysis.
 
     Has methods for assessing portfolio values, grouping transactions by type, 
-    calculate total fees, etc.
+    calculate total fees, etc. Queries are answered by a 
+    :obj:`TransactionIndex` built once, that new transactions are 
+    appended to with :meth:`append`.
 
     With `Portfolio.Analysis.standardize()` it is possible to adapt 
     the `surfingcrypto.coinbase.MyCoinbase` object to a standard form 
@@ -22,28 +249,73 @@ class PortfolioAnalysis:
     Attributes:
         df (:obj:`pandas.DataFrame`): coinbase transaction 
             history as from the `surfingcrypto.coinbase.MyCoinbase` output
+        transactions (:obj:`TransactionIndex`): index of the transactions
         std_df (:obj:`pandas.DataFrame`): standardized transaction history,
              contains only `buy` or `sell`
+        malformed_trades (:obj:`pandas.DataFrame`): `trade_id`, number of `legs`
+            and `error` of trades without exactly two legs
+        missing_timeseries (:obj:`list` of :obj:`str`): symbols left out of 
+            the last `value_timeline` because they have no time series
     """
 
     def __init__(self,mycoinbase_df):
         self.df=mycoinbase_df
+        self.quote_service=None
+        self.missing_timeseries=[]
+        self.transactions=TransactionIndex(mycoinbase_df)
+        self.standardize()
+
+    def append(self,df):
+        """
+        adds new transactions to the history, the index and the 
+        standardized history.
+
+        Arguments:
+            df (:obj:`pandas.DataFrame`): new transactions.
+        """
+        self.df=pd.concat([self.df,df])
+        self.transactions.append(df)
         self.standardize()
 
-    def total_fees(self):
+    def convert(self,fx,currency,standard=False):
         """
-        total fees paid by user for th
+        transaction history with native amounts converted to a currency, 
+        at the exchange rates of the day of each transaction.
+
+        Arguments:
+            fx (:obj:`surfingcrypto.coinbase.FxTable`): exchange rates.
+            currency (str): currency to convert to.
+            standard (bool): convert the standardized history `std_df`.
+
+        Return:
+            :obj:`pandas.DataFrame`: history with converted `native_amount`,
+                `total`, `subtotal`, `total_fee` and `spot_price` and `nat_symbol` set to `currency`.
         """
-        return self.df["total_fee"].sum()
+        df=self.std_df if standard else self.df
+        return fx.convert(df,currency,NATIVE_COLUMNS,"nat_symbol",df.index)
+
+    def total_fees(self,start=None,end=None):
+        """
+        total fees paid by user for the transactions between `start` and `end`.
+
+        Arguments:
+            start (str): first datetime, default the first transaction.
+            end (str): last datetime, default the last transaction.
+        """
+        return self.transactions.total("total_fee",start,end)
     
-    def total_by_type(self):
+    def total_by_type(self,start=None,end=None):
         """
         total EUR by transaction type.
 
+        Arguments:
+            start (str): first datetime, default the first transaction.
+            end (str): last datetime, default the last transaction.
+
         Return:
             :obj:`pandas.DataFrame`
         """
-        return self.df.groupby("type")[["native_amount"]].sum()
+        return self.transactions.totals("native_amount","type",start,end).to_frame()
 
     def live_value(self,client,amount,currency):
         """
@@ -58,28 +330,140 @@ class PortfolioAnalysis:
         change=float(change["amount"])
         return amount*change
 
-    def portfolio_value(self,client):
+    def portfolio_value(self,client,currency="EUR",ttl=60):
         """
         gets live value of portfolio.
 
+        Spot prices of all held currencies are requested at once and reused
+        for `ttl` seconds by a :obj:`surfingcrypto.coinbase.QuoteService`, 
+        kept in `quote_service`, so that the value can be polled often.
+
         Arguments:
-            client (:obj:`surfingcrypto.coinbase.CB.client`) : client to coinbase account.
+            client (:obj:`surfingcrypto.coinbase.CB.client` or :obj:`surfingcrypto.coinbase.QuoteService`) : 
+                client to coinbase account, or quote service to use.
+            currency (str): currency of the value, must match the one 
+                of a given quote service.
+            ttl (float): seconds spot prices are cached, ignored if 
+                a quote service is given.
+
+        Return:
+            :obj:`pandas.DataFrame`: `amount`, `spot_price` and `live_value` of 
+                each held `symbol`, total value is `live_value` sum. Can be converted
+                to another currency with 
+                `fx.convert(value,"USD",["spot_price","live_value"],currency)`.
         """
-        balance=self.df[self.df["type"].isin(["buy","sell","trade","send"])].groupby("symbol")[["amount"]].sum()
+        if isinstance(client,QuoteService):
+            if client.currency!=currency:
+                raise ValueError("Quote service is in "+client.currency+", not "+currency+".")
+            self.quote_service=client
+        elif (self.quote_service is None or self.quote_service.client is not client
+                or self.quote_service.currency!=currency or self.quote_service.ttl!=ttl):
+            self.quote_service=QuoteService(client,currency,ttl)
+
+        balance=self.transactions.balance().to_frame()
         balance=balance.loc[~(balance.round(10)==0.0).all(axis=1)].reset_index()
-        balance["live_value"]=balance.apply(lambda x:self.live_value(client,x["amount"],x["symbol"]),axis=1)
-        print(balance)
-        print("Total portfolio balance: "+"{:.2f}".format(balance["live_value"].sum())+" EUR")
+        balance["spot_price"]=self.quote_service.quotes(balance["symbol"]).to_numpy()
+        balance["live_value"]=balance["amount"]*balance["spot_price"]
+        return balance
+
+    def value_timeline(self,configuration,freq="1D",start=None,end=None,cache=None):
+        """
+        timeline of the portfolio value, from the standardized transactions
+        and the time series of the coins stored locally in `data/ts/`.
+
+        Holdings of each symbol are the cumulative sum of its signed `amount`
+        in `std_df` and in the `send` transactions, which `std_df` leaves out,
+        so that they match the balance of `portfolio_value`. They are joined 
+        as-of the end of each date of the timeline, which is valued at the 
+        last close available at that date. No request is made to coinbase.
+        Symbols without a time series in `data/ts/`, eg. fiat or stablecoin 
+        balances, are left out of the timeline and its `total`, and are 
+        listed in `missing_timeseries`.
+
+        Arguments:
+            configuration (:obj:`surfingcrypto.config.config`): configuration object.
+            freq (str): frequency of the timeline, eg. `1D` or `7D`.
+            start (str): first date, default the day of the first transaction,
+                naive dates are taken as UTC.
+            end (str): last date, default the last close of the time series,
+                naive dates are taken as UTC.
+            cache (dict): closes already read by coin, 
+                see :func:`surfingcrypto.portfolio_tracker.read_closes`.
+
+        Return:
+            :obj:`pandas.DataFrame`: value of each symbol and `total` value,
+                indexed by UTC `Date`, empty if there are no transactions
+                or no time series of the symbols held.
+        """
+        empty=pd.DataFrame(columns=["total"],index=pd.DatetimeIndex([],tz="utc",name="Date"),dtype="float64")
+        self.missing_timeseries=[]
+        sends=self.df[self.df["type"]=="send"]
+        tx=pd.concat([self.std_df[["symbol","type","amount"]],sends[["symbol","type","amount"]]])
+        if len(tx)==0:
+            return empty
+        tx=tx.reset_index()
+        tx.columns=["datetime","symbol","type","amount"]
+        tx["symbol"]=tx["symbol"].astype(str)
+        tx["datetime"]=pd.to_datetime(tx["datetime"],utc=True).astype("datetime64[ns, UTC]")
+        tx["qty"]=np.where(tx["type"]=="sell",-tx["amount"],tx["amount"])
+        tx=tx.sort_values("datetime",kind="stable")
+        tx["holdings"]=tx.groupby("symbol")["qty"].cumsum()
+
+        symbols=[]
+        closes=[]
+        for symbol in sorted(tx["symbol"].unique()):
+            try:
+                c=read_closes(configuration,symbol,cache)
+            except FileNotFoundError:
+                self.missing_timeseries.append(symbol)
+                continue
+            symbols.append(symbol)
+            closes.append(pd.DataFrame({"Date":c.index,"symbol":symbol,"close":c.to_numpy()}))
+        if len(symbols)==0:
+            return empty
+        tx=tx[tx["symbol"].isin(symbols)]
+        closes=pd.concat(closes,ignore_index=True)
+        closes["Date"]=closes["Date"].astype("datetime64[ns, UTC]")
+        closes=closes.sort_values("Date",kind="stable")
+
+        start=tx["datetime"].iloc[0].floor("D") if start is None else _to_utc(start)
+        end=closes["Date"].iloc[-1] if end is None else _to_utc(end)
+        dates=pd.date_range(start,end,freq=freq,name="Date").astype("datetime64[ns, UTC]")
+
+        grid=pd.DataFrame({
+            "Date":np.repeat(dates,len(symbols)),
+            "symbol":np.tile(symbols,len(dates)),
+            })
+        grid["end"]=grid["Date"]+pd.Timedelta(days=1)
+        grid=pd.merge_asof(
+            grid,tx[["datetime","symbol","holdings"]],left_on="end",right_on="datetime",
+            by="symbol",allow_exact_matches=False
+            )
+        grid=pd.merge_asof(grid,closes,on="Date",by="symbol")
+        holdings=grid["holdings"].fillna(0.0).round(10)
+        grid["value"]=np.where(holdings==0.0,0.0,holdings*grid["close"])
 
-    def standardize(self):
+        value=grid.pivot(index="Date",columns="symbol",values="value")[symbols]
+        value.columns.name=None
+        value["total"]=value.sum(axis=1)
+        return value
+
+    def standardize(self,strict=False):
         """
         creates a dataframe of only `buy` and `sell` orders, for easier portfolio analysis.
 
-        It calculates missing fee information of `trade` transactions.
+        It calculates missing fee information of `trade` transactions, as half 
+        the difference between the native amounts of its two legs. 
+        Legs are paired by `trade_id` in a single grouped pass. 
+
+        Trades without exactly two legs are left without fee and reported 
+        in `malformed_trades`.
 
         Note:
             At the moment does not include `send`,`deposit` or `withdrawal` transactions
 
+        Arguments:
+            strict (bool): raise on the first malformed trade instead of reporting it.
         """
         self.std_df=self.df.copy()
         #exclude fiat deposit and withdrawals AND SEND
@@ -93,14 +477,41 @@ class PortfolioAnalysis:
         self.std_df["amount"]=self.std_df["amount"].abs()
         self.std_df["native_amount"]=self.std_df["native_amount"].abs()
 
-        for trade in self.std_df.trade_id.unique():
-            if trade is not None:
-                t=self.std_df[self.std_df["trade_id"]==trade]
-                if len(t)==2:
-                    fee=t["native_amount"].diff()
-                    self.std_df.loc[(self.std_df["trade_id"]==trade),"total_fee"]=fee[-1]/2
-
-                elif len(t)>2:
-                    raise ValueError("More than 2 trades found.")
-                else:
-                    raise ValueError("Did not find 2 trades with matching trade_id")
\ No newline at end of file
+        #pair the legs of each trade by position, first and last leg of each group
+        codes,trades=pd.factorize(self.std_df["trade_id"])
+        legs=np.flatnonzero(codes>=0)
+        count=np.bincount(codes[legs],minlength=len(trades))
+        first=np.full(len(trades),len(self.std_df),dtype="int64")
+        last=np.full(len(trades),-1,dtype="int64")
+        np.minimum.at(first,codes[legs],legs)
+        np.maximum.at(last,codes[legs],legs)
+        native_amount=self.std_df["native_amount"].to_numpy(dtype="float64")
+
+        paired=legs[count[codes[legs]]==2]
+        if "total_fee" not in self.std_df.columns:
+            self.std_df["total_fee"]=np.nan
+        total_fee=self.std_df["total_fee"].to_numpy(dtype="float64",copy=True)
+        pairs=codes[paired]
+        total_fee[paired]=(native_amount[last[pairs]]-native_amount[first[pairs]])/2
+        self.std_df["total_fee"]=total_fee
+
+        malformed=count!=2
+        self.malformed_trades=pd.DataFrame({
+            "trade_id":trades[malformed],
+            "legs":count[malformed],
+            "error":np.where(
+                count[malformed]>2,
+                "More than 2 trades found.",
+                "Did not find 2 trades with matching trade_id"
+                ),
+        })
+        if strict and len(self.malformed_trades)>0:
+            raise ValueError(self.malformed_trades["error"].iloc[0])
+
+
+def _to_utc(date):
+    """
+    UTC timestamp of `date`, naive dates are localized and aware ones converted.
+    """
+    date=pd.Timestamp(date)
+    return date.tz_localize("utc") if date.tz is None else date.tz_convert("utc")
@@ -1,110 +1,449 @@
 import datetime
+import json
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import datetime
-from surfingcrypto.ts import TS
+
+from surfingcrypto.ts_io import read_ts
 # from plotly.offline import init_notebook_mode, iplot
 # init_notebook_mode(connected=True)
 
+#: file name of the tracker checkpoint persisted in the data folder
+STATE_FILE = "tracker_state.json"
+
+#: file name of the open lots at the checkpoint, in the data folder
+LOTS_FILE = "tracker_lots.parquet"
+
+#: folder of the tracker results in the data folder, one parquet file per update
+RESULTS_FOLDER = "tracker"
+
+#: default memory budget of each chunk of portfolio calculations, in bytes
+CHUNK_MEMORY = 256 * 2**20
+
+#: columns added to each row by the per symbol calculations
+SYMBOL_COLUMNS = [
+    'Symbol Adj Close', 'Adj cost daily', 'symbol End Date Close', 'symbol Start Date Close',
+    'symbol Return', 'symbol Share Value', 'Stock Gain / (Loss)'
+    ]
+
+#: columns added to each row for each benchmark, suffixed as in :func:`benchmark_suffixes`
+BENCHMARK_COLUMNS = [
+    'Benchmark Close', 'Benchmark End Date Close', 'Benchmark Start Date Close',
+    'Equiv Benchmark Shares', 'Benchmark Start Date Cost', 'Benchmark Return',
+    'Benchmark Share Value', 'Benchmark Gain / (Loss)', 'Abs Value Compare',
+    'Abs Value Return', 'Abs. Return Compare'
+    ]
+
+#: columns of the transactions, kept in float64 in low memory mode
+LEDGER_COLUMNS = ['Qty', 'Adj cost per share', 'Adj cost']
+
+#: string columns stored as categoricals in low memory mode
+CATEGORICAL_COLUMNS = ['Symbol', 'Type']
+
+#: intermediate columns dropped in low memory mode, with their benchmark suffixes
+INTERMEDIATE_COLUMNS = ('Benchmark End Date Close', 'Adj cost daily')
+
+#: columns of the results needed by :meth:`Tracker.update`, that can not be dropped
+STATE_COLUMNS = ('Date Snapshot', 'Symbol', 'Adj cost', 'symbol Share Value',
+                 'Stock Gain / (Loss)', 'Benchmark Share Value', 'Benchmark Gain / (Loss)')
+
 
 class Tracker:
+    """
+    Tracker of the daily returns of a portfolio compared to benchmarks.
 
-    def __init__(self,portfolio_df,configuration):
+    Arguments:
+        portfolio_df (:obj:`pandas.DataFrame`): transactions.
+        configuration (:obj:`surfingcrypto.config.config`): configuration object.
+        low_memory (bool): store `Symbol` and `Type` as categoricals and drop 
+            the intermediate columns of the results, see :func:`compact_frame`.
+        float32 (bool): in low memory mode, store the derived metrics of 
+            the results as float32.
+        drop_columns (:obj:`list` of :obj:`str`): columns dropped from 
+            the results in low memory mode, default :data:`INTERMEDIATE_COLUMNS`,
+            except :data:`STATE_COLUMNS`.
+
+    Attributes:
+        memory_log (:obj:`list` of :obj:`dict`): memory usage of the 
+            frames compacted in low memory mode, see :meth:`memory_report`.
+    """
+
+    def __init__(self,portfolio_df,configuration,low_memory=False,float32=False,
+            drop_columns=None):
+        drop_columns=list(INTERMEDIATE_COLUMNS if drop_columns is None else drop_columns)
+        needed=[c for c in drop_columns if c in STATE_COLUMNS]
+        if needed:
+            raise ValueError("Columns needed by update can not be dropped: "+", ".join(needed))
         self.configuration=configuration
+        self.low_memory=low_memory
+        self.float32=float32
+        self.drop_columns=drop_columns
+        self.memory_log=[]
 
+        if low_memory:
+            portfolio_df=self.compact("portfolio_df",portfolio_df,results=False)
         self.portfolio_df=portfolio_df
 
         self.stocks_start = pd.Timestamp(self.portfolio_df["Open date"].min().date(),tz="utc")
         self.stocks_end = pd.Timestamp(datetime.datetime.now(datetime.timezone.utc).date()+datetime.timedelta(-1),tz="utc")
 
-        pass
+        # closes read from local time series, shared by the loaders
+        self._closes = {}
 
-    def load_data(self):
+    @property
+    def calendar(self):
         """
-        loads required data from configuration object
+        :obj:`pandas.DatetimeIndex`: daily dates from `stocks_start` to `stocks_end`.
         """
-        self.error_log=[]
-        dfs=[]
+        return pd.date_range(start=self.stocks_start,end=self.stocks_end,freq="1D")
 
-        symbols = self.portfolio_df.Symbol.unique()
+    def load_data(self, max_workers=8):
+        """
+        loads closes of the portfolio symbols from local time series, 
+        within their coinbase requirements.
 
-        for symbol in symbols:
-            try:
-                ts=TS(configuration=self.configuration,coin=symbol)
-                start=self.configuration.coinbase_req[symbol]["start"]
-                end_day=self.configuration.coinbase_req[symbol]["end_day"]
-                df=ts.df.loc[start:end_day,["Close"]]
-                df["symbol"]=symbol
-                dfs.append(df)
+        Symbols whose data can not be loaded are recorded in `error_log`.
 
-            except Exception as e:
-                self.error_log.append({
-                    "symbol":symbol,
-                    "error":e
-                })
-        
-        closedata=pd.concat(dfs, sort=True)
-        closedata.reset_index(inplace=True)
-        return closedata
+        Arguments:
+            max_workers (int): number of time series read in parallel.
+
+        Return:
+            :obj:`pandas.DataFrame`: price panel, see :func:`load_price_panel`.
+        """
+        self.prices, self.error_log = load_price_panel(
+            self.configuration,
+            self.portfolio_df.Symbol.unique(),
+            self.calendar,
+            bounds=self.configuration.coinbase_req,
+            max_workers=max_workers,
+            cache=self._closes
+        )
+        return self.prices
     
     def set_benchmark(self,benchmark):
-        ts=TS(configuration=self.configuration,coin=benchmark)
-        df=ts.df.copy()
-        if df.index.min()<=self.stocks_start and df.index.max()>=self.stocks_end:
-            df = df.loc[self.stocks_start:self.stocks_end,["Close"]]
-            df.reset_index(inplace=True)
-            return df
+        """
+        loads closes of the benchmarks from local time series.
+
+        Arguments:
+            benchmark (str or :obj:`list` of :obj:`str`): benchmark coin, 
+                or list of benchmark coins compared in the same pass.
+
+        Return:
+            :obj:`pandas.Series` or :obj:`pandas.DataFrame`: benchmark closes 
+                at each date of the calendar, one column per benchmark if a list.
+        """
+        if not isinstance(benchmark, str):
+            return pd.concat([self.set_benchmark(coin) for coin in benchmark], axis=1)
+        closes = read_closes(self.configuration, benchmark, self._closes)
+        if closes.index.min()<=self.stocks_start and closes.index.max()>=self.stocks_end:
+            return closes.reindex(self.calendar)
         else:
-            raise ValueError("Local data is not sufficient for purpose.")
+            raise ValueError(f"Local data of {benchmark} is not sufficient for purpose.")
 
     def portfolio_start_balance(self,portfolio, start_date):
+        """
+        open lots at `start_date`, after FIFO matching of the previous sales, 
+        followed by all later transactions.
+        """
         positions_before_start = portfolio[portfolio['Open date'] <= start_date]
-        future_positions = portfolio[portfolio['Open date'] >= start_date]
-        sales = positions_before_start[positions_before_start['Type'] == 'sell'].groupby(['Symbol'])['Qty'].sum()
-        sales = sales.reset_index()
-        positions_no_change = positions_before_start[~positions_before_start['Symbol'].isin(sales['Symbol'].unique())]
-        adj_positions_df = pd.DataFrame()
-        for sale in sales.iterrows():
-            adj_positions = position_adjust(positions_before_start, sale)
-            adj_positions_df = adj_positions_df.append(adj_positions)
-        adj_positions_df = adj_positions_df.append(positions_no_change)
-        adj_positions_df = adj_positions_df.append(future_positions)
+        future_positions = portfolio[portfolio['Open date'] > start_date]
+        remaining, self.realized_lots = fifo_lots(positions_before_start)
+        adj_positions_df = positions_before_start[positions_before_start['Type'] == 'buy'].copy()
+        adj_positions_df['Qty'] = remaining[(positions_before_start['Type'] == 'buy').to_numpy()]
+        adj_positions_df = pd.concat([adj_positions_df, future_positions])
         adj_positions_df = adj_positions_df[adj_positions_df['Qty'] > 0]
         return adj_positions_df
     
-    def time_fill(self,portfolio):
-        calendar=pd.date_range(start=self.stocks_start,end=self.stocks_end,freq="1d")
-        sales = portfolio[portfolio['Type'] == 'sell'].groupby(['Symbol','Open date'])['Qty'].sum()
-        sales = sales.reset_index()
-        per_day_balance = []
-        for date in calendar:
-            if (sales['Open date'] == date).any():
-                portfolio = fifo(portfolio, sales, date)
-            daily_positions = portfolio[portfolio['Open date'] <= date]
-            daily_positions = daily_positions[daily_positions['Type'] == 'buy']
-            daily_positions['Date Snapshot'] = date
-            per_day_balance.append(daily_positions)
-        return per_day_balance
+    def time_fill(self,portfolio,long=False):
+        """
+        holdings at each day of the tracker calendar, sales are matched FIFO
+        on the first snapshot after them.
+
+        Arguments:
+            portfolio (:obj:`pandas.DataFrame`): transactions.
+            long (bool): return the open lots of each day instead 
+                of the dense holdings matrix.
+
+        Return:
+            holdings (:obj:`pandas.DataFrame`): days × symbols holdings matrix,
+                see :func:`holdings_matrix`, or if `long` a :obj:`list` of 
+                :obj:`pandas.DataFrame`, one frame of open lots for each date 
+                with open positions, dated by `Date Snapshot`.
+        """
+        calendar=self.calendar
+        if not long:
+            return holdings_matrix(portfolio, calendar)
+        daily_positions = lots_timeline(portfolio, calendar)
+        return [df for _, df in daily_positions.groupby('Date Snapshot', sort=True)]
+
+    def iter_time_fill(self,portfolio,max_rows=1000000):
+        """
+        open buy lots at each day of the tracker calendar, generated lazily
+        in frames of whole days, see :func:`iter_lots_timeline`.
+
+        Arguments:
+            portfolio (:obj:`pandas.DataFrame`): transactions.
+            max_rows (int): maximum rows of each frame, unless a single day exceeds it.
+        """
+        return iter_lots_timeline(portfolio, self.calendar, max_rows)
     
     def per_day_portfolio_calcs(
             self,
             per_day_holdings,
             daily_benchmark,
             daily_adj_close,
-            stocks_start
+            stocks_start,
+            memory_budget=CHUNK_MEMORY,
+            path=None
         ):
-        df = pd.concat(per_day_holdings, sort=True)
-        mcps = modified_cost_per_share(df, daily_adj_close, stocks_start)
-        bpc = benchmark_portfolio_calcs(mcps, daily_benchmark)
-        pes = portfolio_end_of_year_stats(bpc, daily_adj_close)
-        pss = portfolio_start_of_year_stats(pes, daily_adj_close)
-        returns = calc_returns(pss)
-        return returns
+        """
+        daily returns of the holdings compared to the benchmark, 
+        computed chunk by chunk, see :meth:`iter_portfolio_calcs`.
+
+        Arguments:
+            per_day_holdings (:obj:`pandas.DataFrame` or iterable): holdings matrix,
+                or frames of open lots from :meth:`time_fill` or :meth:`iter_time_fill`.
+            daily_benchmark (:obj:`pandas.Series` or :obj:`pandas.DataFrame`): 
+                benchmark closes by date, one column per benchmark.
+            daily_adj_close (:obj:`pandas.DataFrame`): price panel.
+            stocks_start (:obj:`pandas.Timestamp`): start date.
+            memory_budget (int): approximate bytes of each chunk.
+            path (str): folder where results are written chunk by chunk, in 
+                numbered parquet files, instead of being returned.
+
+        Return:
+            :obj:`pandas.DataFrame`: one row for each open lot (per day open lots)
+                or for each held symbol (holdings matrix) at each `Date Snapshot`,
+                `None` if written to `path`.
+        """
+        chunks = self.iter_portfolio_calcs(
+            per_day_holdings, daily_benchmark, daily_adj_close, stocks_start, memory_budget)
+        if path is None:
+            chunks = list(chunks)
+            return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        os.makedirs(path, exist_ok=True)
+        for i, chunk in enumerate(chunks):
+            chunk.reset_index(drop=True).to_parquet(os.path.join(path, f"{i:05d}.parquet"))
+
+    def iter_portfolio_calcs(
+            self,
+            per_day_holdings,
+            daily_benchmark,
+            daily_adj_close,
+            stocks_start,
+            memory_budget=CHUNK_MEMORY
+        ):
+        """
+        generates the daily returns of the holdings in chunks of rows 
+        whose size, with the computed columns, is about `memory_budget`.
+
+        Holdings matrices are split in chunks of days. Frames of open lots
+        are consumed lazily and gathered until the budget is reached, 
+        so that only one chunk is held in memory when these are generated
+        by :meth:`iter_time_fill`.
+
+        Arguments:
+            per_day_holdings (:obj:`pandas.DataFrame` or iterable): holdings matrix,
+                or frames of open lots from :meth:`time_fill` or :meth:`iter_time_fill`.
+            daily_benchmark (:obj:`pandas.Series` or :obj:`pandas.DataFrame`): 
+                benchmark closes by date, one column per benchmark.
+            daily_adj_close (:obj:`pandas.DataFrame`): price panel.
+            stocks_start (:obj:`pandas.Timestamp`): start date.
+            memory_budget (int): approximate bytes of each chunk.
+
+        Yields:
+            :obj:`pandas.DataFrame`: results of a chunk.
+        """
+        if isinstance(per_day_holdings, pd.DataFrame):
+            n_symbols = per_day_holdings.shape[1] // len(HOLDINGS_FIELDS)
+            columns = calc_columns(daily_benchmark)
+            days = max(1, int(memory_budget // (8 * columns * max(n_symbols, 1))))
+            for i in range(0, len(per_day_holdings), days):
+                yield self._compact_results(holdings_portfolio_calcs(
+                    per_day_holdings.iloc[i:i + days], daily_benchmark, daily_adj_close))
+            return
+        columns = calc_columns(daily_benchmark)
+        chunk, size = [], 0
+        for df in per_day_holdings:
+            if len(df) == 0:
+                continue
+            chunk.append(df)
+            size += df.memory_usage(deep=True).sum() + 8 * columns * len(df)
+            if size >= memory_budget:
+                yield self._compact_results(lots_portfolio_calcs(
+                    pd.concat(chunk), daily_benchmark, daily_adj_close, stocks_start))
+                chunk, size = [], 0
+        if chunk:
+            yield self._compact_results(lots_portfolio_calcs(
+                pd.concat(chunk), daily_benchmark, daily_adj_close, stocks_start))
+
+    def compact(self, name, df, results=True):
+        """
+        compacts a frame with :func:`compact_frame`, logging its memory 
+        usage before and after in `memory_log`.
+
+        Arguments:
+            name (str): name of the frame in the log.
+            df (:obj:`pandas.DataFrame`): frame.
+            results (bool): the frame holds results, whose intermediate 
+                columns are dropped and derived metrics can be float32.
+
+        Return:
+            :obj:`pandas.DataFrame`: compacted frame.
+        """
+        before = df.memory_usage(deep=True).sum()
+        if results:
+            df = compact_frame(df, self.float32, self.drop_columns)
+        else:
+            df = compact_frame(df)
+        self.memory_log.append({
+            "frame": name,
+            "rows": len(df),
+            "before": before,
+            "after": df.memory_usage(deep=True).sum(),
+        })
+        return df
+
+    def memory_report(self):
+        """
+        memory usage of the frames compacted in low memory mode.
+
+        Return:
+            :obj:`pandas.DataFrame`: rows and MB `before` and `after` 
+                compaction of each frame, results summed over their chunks.
+        """
+        report = pd.DataFrame(self.memory_log, columns=["frame", "rows", "before", "after"])
+        report = report.groupby("frame", sort=False).sum()
+        report[["before", "after"]] /= 2**20
+        report["ratio"] = report["after"] / report["before"]
+        return report
+
+    def _compact_results(self, df):
+        if self.low_memory:
+            return self.compact("results", df)
+        return df
     
-    def plot(self,combined_df):
-        self.line_facets(combined_df, 'symbol Return', 'Benchmark Return')
-        self.line(combined_df, 'Stock Gain / (Loss)', 'Benchmark Gain / (Loss)')
+    def update(self, daily_benchmark, daily_adj_close):
+        """
+        incremental daily update of the tracker results.
+
+        Only the dates after the checkpoint in `tracker_state.json` are computed,
+        starting from the open lots persisted at the checkpoint and the transactions
+        that followed it, and appended to the results in the `tracker` folder.
+        Without a checkpoint the whole history since `stocks_start` is computed.
+        Cost basis of lots opened before `stocks_start` is restated at the 
+        start closes persisted in the checkpoint, so that results match 
+        the ones of a full run.
+
+        The checkpoint is discarded, together with the persisted results, 
+        if it was computed from another `stocks_start` or other benchmarks,
+        and the whole history is computed again.
+
+        Note:
+            Transactions dated at or before the checkpoint are not read again,
+            delete the checkpoint to recompute the history after changing them.
+            `End Date Close` columns refer to the last date of each update.
+
+        Arguments:
+            daily_benchmark (:obj:`pandas.Series` or :obj:`pandas.DataFrame`): 
+                benchmark closes by date, one column per benchmark.
+            daily_adj_close (:obj:`pandas.DataFrame`): price panel.
+
+        Return:
+            :obj:`pandas.DataFrame`: results of the new dates.
+        """
+        benchmarks = benchmark_names(daily_benchmark)
+        state = self.load_state()
+        if state is not None and (
+                state.get('stocks_start') != self.stocks_start.isoformat()
+                or state.get('benchmarks') != benchmarks):
+            shutil.rmtree(self._data_path(RESULTS_FOLDER), ignore_errors=True)
+            state = None
+        if state is None:
+            portfolio = self.portfolio_df
+            first = self.stocks_start
+            start_close = daily_adj_close.iloc[0]
+            benchmark_start = daily_benchmark.iloc[0]
+        else:
+            last = pd.Timestamp(state['last_date'])
+            new = self.portfolio_df[self.portfolio_df['Open date'] > last]
+            portfolio = pd.concat([pd.read_parquet(self._data_path(LOTS_FILE)), new])
+            first = last + pd.Timedelta(days=1)
+            start_close = pd.Series(state['start_close'], dtype='float64')
+            benchmark_start = state['benchmark_start']
+            if isinstance(benchmark_start, dict):
+                benchmark_start = pd.Series(benchmark_start, dtype='float64')
+        if first > self.stocks_end:
+            return pd.DataFrame()
+
+        calendar = pd.date_range(start=first, end=self.stocks_end, freq="1D")
+        holdings = holdings_matrix(portfolio, calendar, start=self.stocks_start)
+        results = self._compact_results(holdings_portfolio_calcs(
+            holdings, daily_benchmark, daily_adj_close, start_close, benchmark_start))
+
+        # checkpoint: open lots and metrics at the last computed date
+        portfolio = portfolio[portfolio['Open date'] <= self.stocks_end]
+        remaining, _ = fifo_lots(portfolio)
+        lots = portfolio[remaining > LOT_EPS].copy()
+        lots['Qty'] = remaining[remaining > LOT_EPS]
+        lots['Adj cost'] = lots['Qty'] * lots['Adj cost per share']
+        os.makedirs(self._data_path(RESULTS_FOLDER), exist_ok=True)
+        results.to_parquet(self._data_path(
+            RESULTS_FOLDER, calendar[0].strftime("%Y-%m-%d") + ".parquet"))
+        lots.to_parquet(self._data_path(LOTS_FILE))
+        last = results[results['Date Snapshot'] == calendar[-1]]
+        self.dump_state({
+            'stocks_start': self.stocks_start.isoformat(),
+            'benchmarks': benchmarks,
+            'last_date': calendar[-1].isoformat(),
+            'start_close': start_close.dropna().to_dict(),
+            'benchmark_start': (
+                benchmark_start.to_dict() if isinstance(benchmark_start, pd.Series)
+                else float(benchmark_start)),
+            'metrics': last[
+                ['Adj cost', 'symbol Share Value', 'Stock Gain / (Loss)']
+                + ['Benchmark Share Value' + x for x in benchmark_suffixes(daily_benchmark)]
+                + ['Benchmark Gain / (Loss)' + x for x in benchmark_suffixes(daily_benchmark)]
+                ].sum().to_dict(),
+        })
+        return results
+
+    def load_results(self):
+        """
+        loads all the results persisted by :meth:`update`.
+        """
+        return pd.read_parquet(self._data_path(RESULTS_FOLDER)).sort_values(
+            ['Date Snapshot', 'Symbol'], ignore_index=True)
+
+    def load_state(self):
+        """
+        loads the tracker checkpoint from `tracker_state.json`, if any.
+        """
+        path = self._data_path(STATE_FILE)
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                return json.load(f)
+
+    def dump_state(self, state):
+        """
+        dumps the tracker checkpoint to `tracker_state.json`.
+        """
+        with open(self._data_path(STATE_FILE), "w") as f:
+            json.dump(state, f, indent=4)
+
+    def _data_path(self, *names):
+        return os.path.join(self.configuration.data_folder, *names)
+
+    def plot(self,combined_df,benchmark=None):
+        suffix = '' if benchmark is None else ' ' + benchmark
+        self.line_facets(combined_df, 'symbol Return', 'Benchmark Return' + suffix)
+        self.line(combined_df, 'Stock Gain / (Loss)', 'Benchmark Gain / (Loss)' + suffix)
 
     def line_facets(self,df, val_1, val_2):
         grouped_metrics = df.groupby(['Symbol','Date Snapshot'])[[val_1,val_2]].sum().reset_index()
@@ -123,89 +462,671 @@ class Tracker:
         iplot(fig)
 
 
-def position_adjust(daily_positions, sale):
-    stocks_with_sales = pd.DataFrame()
-    buys_before_start = daily_positions[daily_positions['Type'] == 'buy'].sort_values(by='Open date')
-    for position in buys_before_start[buys_before_start['Symbol'] == sale[1]['Symbol']].iterrows():
-        if position[1]['Qty'] <= sale[1]['Qty']:
-            sale[1]['Qty'] -= position[1]['Qty']
-            position[1]['Qty'] = 0
-        else:
-            position[1]['Qty'] -= sale[1]['Qty']
-            sale[1]['Qty'] -= sale[1]['Qty']
-        stocks_with_sales = stocks_with_sales.append(position[1])
-    return stocks_with_sales
-
-def fifo(daily_positions, sales, date):
-    sales = sales[sales['Open date'] == date]
-    daily_positions = daily_positions[daily_positions['Open date'] <= date]
-    positions_no_change = daily_positions[~daily_positions['Symbol'].isin(sales['Symbol'].unique())]
-    adj_positions = pd.DataFrame()
-    for sale in sales.iterrows():
-        adj_positions = adj_positions.append(position_adjust(daily_positions, sale))
-    adj_positions = adj_positions.append(positions_no_change)
-    adj_positions = adj_positions[adj_positions['Qty'] > 0]
-    return adj_positions
+#: tolerance under which a lot is considered fully sold
+LOT_EPS = 1e-12
+
+
+def fifo_lots(portfolio):
+    """
+    FIFO matching of sales to the buy lots of the same symbol, 
+    in a single pass over the transactions sorted by date.
+
+    Open lots of each symbol are kept in a deque of row positions, 
+    buys being matched before sales at the same instant. 
+    Sales exceeding the open quantity are matched only up to it.
+
+    Arguments:
+        portfolio (:obj:`pandas.DataFrame`): transactions with `Open date`, 
+            `Type`, `Symbol`, `Qty` and `Adj cost per share` columns.
+
+    Return:
+        remaining (:obj:`numpy.ndarray`): remaining quantity of each row of 
+            `portfolio` (0 for sales).
+        realized (:obj:`pandas.DataFrame`): one record for each part of a lot 
+            closed by a sale, with buy and sale row positions (`lot`, `sale`).
+    """
+    dates = portfolio['Open date']
+    symbols = portfolio['Symbol'].to_numpy()
+    qty = portfolio['Qty'].to_numpy(dtype='float64')
+    is_buy = (portfolio['Type'] == 'buy').to_numpy()
+    is_sell = (portfolio['Type'] == 'sell').to_numpy()
+    remaining = np.where(is_buy, qty, 0.0)
+
+    lots = {}
+    lot_idx, sale_idx, closed = [], [], []
+    for i in np.lexsort((is_sell, dates.values)):
+        if is_buy[i]:
+            lots.setdefault(symbols[i], deque()).append(i)
+        elif is_sell[i]:
+            to_sell = qty[i]
+            queue = lots.get(symbols[i], ())
+            while to_sell > LOT_EPS and queue:
+                j = queue[0]
+                take = min(to_sell, remaining[j])
+                remaining[j] -= take
+                to_sell -= take
+                lot_idx.append(j)
+                sale_idx.append(i)
+                closed.append(take)
+                if remaining[j] <= LOT_EPS:
+                    remaining[j] = 0.0
+                    queue.popleft()
+
+    lot_idx = np.array(lot_idx, dtype='int64')
+    sale_idx = np.array(sale_idx, dtype='int64')
+    closed = np.array(closed, dtype='float64')
+    cost = portfolio['Adj cost per share'].to_numpy(dtype='float64')
+    realized = pd.DataFrame({
+        'lot': lot_idx,
+        'sale': sale_idx,
+        'Symbol': symbols[lot_idx],
+        'Open date': dates.iloc[lot_idx].array,
+        'Close date': dates.iloc[sale_idx].array,
+        'Qty': closed,
+        'Adj cost per share': cost[lot_idx],
+        'Sale price per share': cost[sale_idx],
+    })
+    realized['Realized Gain / (Loss)'] = realized['Qty'] * (
+        realized['Sale price per share'] - realized['Adj cost per share'])
+    return remaining, realized
+
+
+def lots_timeline(portfolio, calendar):
+    """
+    open quantity of every buy lot at each date of `calendar`, 
+    from FIFO matched sales.
+
+    Transactions are accounted from the first calendar date not earlier 
+    than their `Open date`. The quantity of each lot is constant between 
+    its events (opening and partial sales), so its rows are obtained 
+    by repeating these segments.
+
+    Arguments:
+        portfolio (:obj:`pandas.DataFrame`): transactions.
+        calendar (:obj:`pandas.DatetimeIndex`): sorted snapshot dates.
+
+    Return:
+        :obj:`pandas.DataFrame`: buy rows of `portfolio` with the open `Qty`
+            at each `Date Snapshot`, only when positive.
+    """
+    portfolio, segments = lot_segments(portfolio, calendar)
+    return expand_segments(portfolio, segments, calendar)
+
+
+def iter_lots_timeline(portfolio, calendar, max_rows=1000000):
+    """
+    open quantity of every buy lot at each date of `calendar`, 
+    generated in frames of consecutive whole days, see :func:`lots_timeline`.
+
+    Arguments:
+        portfolio (:obj:`pandas.DataFrame`): transactions.
+        calendar (:obj:`pandas.DatetimeIndex`): sorted snapshot dates.
+        max_rows (int): maximum rows of each frame, unless a single day exceeds it.
+
+    Yields:
+        :obj:`pandas.DataFrame`: open lots of some days.
+    """
+    portfolio, (lot, start, end, qty) = lot_segments(portfolio, calendar)
+    n_days = len(calendar)
+    rows = np.cumsum(np.bincount(start, minlength=n_days + 1)
+                     - np.bincount(end, minlength=n_days + 1))[:n_days]
+    cum_rows = np.cumsum(rows)
+    first = 0
+    while first < n_days:
+        done = cum_rows[first - 1] if first else 0
+        last = max(int(np.searchsorted(cum_rows, done + max_rows, side='right')), first + 1)
+        last = min(last, n_days)
+        seg_start, seg_end = np.maximum(start, first), np.minimum(end, last)
+        keep = seg_end > seg_start
+        if keep.any():
+            yield expand_segments(
+                portfolio, (lot[keep], seg_start[keep], seg_end[keep], qty[keep]), calendar)
+        first = last
+
+
+def lot_segments(portfolio, calendar):
+    """
+    segments of days of `calendar` where the open quantity of a lot 
+    is constant and positive.
+
+    Return:
+        portfolio (:obj:`pandas.DataFrame`): transactions, reindexed by position.
+        segments (:obj:`tuple` of :obj:`numpy.ndarray`): lot row, first day,
+            day after the last and open quantity of each segment.
+    """
+    portfolio = portfolio.reset_index(drop=True)
+    remaining, realized = fifo_lots(portfolio)
+    buys = np.flatnonzero((portfolio['Type'] == 'buy').to_numpy())
+    open_day = calendar.searchsorted(pd.DatetimeIndex(portfolio['Open date'].iloc[buys]))
+    sale_day = calendar.searchsorted(pd.DatetimeIndex(realized['Close date']))
+
+    # events: opening (+qty) and sales (-qty) of each lot, by day
+    events = pd.DataFrame({
+        'lot': np.concatenate([buys, realized['lot'].to_numpy()]),
+        'day': np.concatenate([open_day, sale_day]),
+        'delta': np.concatenate([
+            portfolio['Qty'].to_numpy(dtype='float64')[buys],
+            -realized['Qty'].to_numpy()]),
+    })
+    events = events.groupby(['lot', 'day'], sort=True)['delta'].sum().reset_index()
+    lot = events['lot'].to_numpy()
+    start = events['day'].to_numpy()
+    qty = events.groupby('lot')['delta'].cumsum().to_numpy()
+    end = np.append(start[1:], len(calendar))
+    end[np.append(lot[1:] != lot[:-1], True)] = len(calendar)
+    keep = (qty > LOT_EPS) & (end > start)
+    return portfolio, (lot[keep], start[keep], end[keep], qty[keep])
+
+
+def expand_segments(portfolio, segments, calendar):
+    """
+    one row of `portfolio` for each day of each lot segment, dated by `Date Snapshot`.
+    """
+    lot, start, end, qty = segments
+    length = end - start
+    rows = np.repeat(lot, length)
+    offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    daily = portfolio.iloc[rows].reset_index(drop=True)
+    daily['Qty'] = np.repeat(qty, length)
+    daily['Date Snapshot'] = calendar[np.repeat(start, length) + offset]
+    return daily
+
+
+#: fields of the holdings matrix
+HOLDINGS_FIELDS = ['Qty', 'Adj cost', 'Start Qty', 'Start Adj cost']
+
+
+def holdings_matrix(portfolio, calendar, start=None):
+    """
+    dense days × symbols holdings, from cumulative FIFO matched buy/sell deltas.
+
+    Quantity and cost changes of each lot are summed by day and symbol 
+    and accumulated over `calendar`, so that memory does not depend 
+    on the number of open lots. Lots opened up to `start` are also accounted 
+    in `Start Qty` and `Start Adj cost`, for their cost to be restated 
+    at the start date close.
+
+    Arguments:
+        portfolio (:obj:`pandas.DataFrame`): transactions.
+        calendar (:obj:`pandas.DatetimeIndex`): sorted snapshot dates.
+        start (:obj:`pandas.Timestamp`): start date, default the first date of `calendar`.
+
+    Return:
+        :obj:`pandas.DataFrame`: holdings indexed by `Date Snapshot`, with 
+            (field, symbol) columns for each of :data:`HOLDINGS_FIELDS`.
+    """
+    portfolio = portfolio.reset_index(drop=True)
+    remaining, realized = fifo_lots(portfolio)
+    buys = np.flatnonzero((portfolio['Type'] == 'buy').to_numpy())
+    symbols, code = np.unique(portfolio['Symbol'].to_numpy(), return_inverse=True)
+    cost = portfolio['Adj cost per share'].to_numpy(dtype='float64')
+    open_day = np.full(len(portfolio), -1)
+    open_day[buys] = calendar.searchsorted(pd.DatetimeIndex(portfolio['Open date'].iloc[buys]))
+
+    lot = np.concatenate([buys, realized['lot'].to_numpy()])
+    day = np.concatenate([
+        open_day[buys], calendar.searchsorted(pd.DatetimeIndex(realized['Close date']))])
+    delta = np.concatenate([
+        portfolio['Qty'].to_numpy(dtype='float64')[buys], -realized['Qty'].to_numpy()])
+    if start is None:
+        start = calendar[0]
+    at_start = (portfolio['Open date'] <= start).to_numpy()[lot]
+
+    # events after the calendar end fall in an extra, discarded day
+    n_days, n_symbols = len(calendar), len(symbols)
+    cell = day * n_symbols + code[lot]
+    matrix = np.stack([
+        np.bincount(cell, weights=weights, minlength=(n_days + 1) * n_symbols)
+        for weights in [delta, delta * cost[lot], delta * at_start, delta * cost[lot] * at_start]
+    ]).reshape(len(HOLDINGS_FIELDS), n_days + 1, n_symbols)[:, :n_days].cumsum(axis=1)
+    matrix[:, np.abs(matrix[0]) <= LOT_EPS] = 0.0
+
+    columns = pd.MultiIndex.from_product([HOLDINGS_FIELDS, symbols])
+    index = pd.DatetimeIndex(calendar, name='Date Snapshot')
+    return pd.DataFrame(
+        matrix.transpose(1, 0, 2).reshape(n_days, -1), index=index, columns=columns)
+
+
+def holdings_portfolio_calcs(holdings, benchmark, adj_close, start_close=None, benchmark_start=None):
+    """
+    returns of a holdings matrix compared to the benchmark, 
+    computed on days × symbols arrays.
+
+    Same columns of the per lot calculations, aggregated by symbol: 
+    `Adj cost per share` is the average cost of the open lots 
+    and `symbol Return` the return on it.
+
+    Arguments:
+        holdings (:obj:`pandas.DataFrame`): output of :func:`holdings_matrix`.
+        benchmark (:obj:`pandas.Series` or :obj:`pandas.DataFrame`): benchmark 
+            closes by date, one column per benchmark.
+        adj_close (:obj:`pandas.DataFrame`): price panel.
+        start_close (:obj:`pandas.Series`): start date closes by symbol, 
+            default the first row of `adj_close`.
+        benchmark_start (float or :obj:`pandas.Series`): start date close of 
+            the benchmarks, see :func:`benchmark_portfolio_calcs`.
+
+    Return:
+        :obj:`pandas.DataFrame`: one row for each held symbol at each `Date Snapshot`.
+    """
+    calendar = holdings.index
+    symbols = holdings['Qty'].columns
+    closes = adj_close.reindex(columns=symbols)
+    price = closes.reindex(calendar).to_numpy(dtype='float64')
+    if start_close is None:
+        start_close = closes.iloc[0]
+    start_close = start_close.reindex(symbols).to_numpy(dtype='float64')
+    end_close = closes.iloc[-1].to_numpy(dtype='float64')
+
+    qty = holdings['Qty'].to_numpy()
+    start_qty = holdings['Start Qty'].to_numpy()
+    start_cost = np.where(start_qty > LOT_EPS, start_qty * start_close, 0.0)
+    cost = holdings['Adj cost'].to_numpy() - holdings['Start Adj cost'].to_numpy() + start_cost
+    day, sym = np.nonzero(qty > LOT_EPS)
+    qty, cost = qty[day, sym], cost[day, sym]
+    portfolio = pd.DataFrame({
+        'Date Snapshot': calendar[day],
+        'Symbol': symbols[sym],
+        'Qty': qty,
+        'Symbol Adj Close': price[day, sym],
+        'symbol End Date Close': end_close[sym],
+        'symbol Start Date Close': start_close[sym],
+        'Adj cost per share': cost / qty,
+        'Adj cost': cost,
+    })
+    portfolio['Adj cost daily'] = portfolio['Symbol Adj Close'] * portfolio['Qty']
+    portfolio = calc_returns(portfolio)
+    return benchmark_portfolio_calcs(portfolio, benchmark, benchmark_start)
+
+
+def evaluate_scenarios(scenarios, prices, calendar=None, shard_size=64, max_workers=None, daily=False):
+    """
+    what-if evaluation of many hypothetical portfolios against one price panel.
+
+    Holdings of each shard of scenarios are computed at once on 
+    scenario × day × symbol arrays from their FIFO matched transactions,
+    and valued at the closes of the panel (last close carried forward).
+    Shards are evaluated in turn, or by a pool of `max_workers` processes.
+
+    Summary columns:
+        `Final Value` of the holdings at the last date, `Invested` cost 
+        of the buys, `Proceeds` of the sales, `Gain / (Loss)`, `Return`
+        on the invested cost, `Time Weighted Return` and `Max Drawdown`
+        of the time weighted index of daily returns, net of buys and sales.
+
+    Arguments:
+        scenarios (:obj:`dict` of :obj:`pandas.DataFrame`): transactions of 
+            each scenario by name, in the format of the tracker.
+        prices (:obj:`pandas.DataFrame`): price panel, see :func:`load_price_panel`.
+        calendar (:obj:`pandas.DatetimeIndex`): dates, default the panel dates.
+        shard_size (int): scenarios evaluated together, bounding memory 
+            to `shard_size` × days × symbols arrays.
+        max_workers (int): processes evaluating the shards, `None` to
+            evaluate them in this process.
+        daily (bool): return also the daily values of the scenarios.
+
+    Return:
+        summary (:obj:`pandas.DataFrame`): metrics indexed by `Scenario`.
+        values (:obj:`pandas.DataFrame`): if `daily`, value of the holdings 
+            of each scenario (columns) at each date.
+    """
+    if calendar is None:
+        calendar = prices.index
+    names = list(scenarios)
+    shards = [
+        {name: scenarios[name] for name in names[i:i + shard_size]}
+        for i in range(0, len(names), shard_size)
+    ]
+    if max_workers is None:
+        results = [_evaluate_shard(shard, prices, calendar) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_evaluate_shard, shards, repeat(prices), repeat(calendar)))
+    summary = pd.concat([r[0] for r in results])
+    if daily:
+        return summary, pd.concat([r[1] for r in results], axis=1)
+    return summary
+
+
+def _evaluate_shard(scenarios, prices, calendar):
+    names = list(scenarios)
+    n_scenarios, n_days, n_symbols = len(names), len(calendar), len(prices.columns)
+    price = np.nan_to_num(prices.reindex(calendar).ffill().to_numpy(dtype='float64'))
+
+    # events of all scenarios: (scenario, day, symbol) cells and amounts
+    cells, deltas, flow_cells, invested, proceeds = [], [], [], [], []
+    for k, name in enumerate(names):
+        ledger = scenarios[name].reset_index(drop=True)
+        _, realized = fifo_lots(ledger)
+        buys = np.flatnonzero((ledger['Type'] == 'buy').to_numpy())
+        code = prices.columns.get_indexer(ledger['Symbol'])
+        if (code[buys] < 0).any():
+            raise ValueError(f"Prices of scenario {name} not found.")
+        qty = ledger['Qty'].to_numpy(dtype='float64')
+        cost = ledger['Adj cost per share'].to_numpy(dtype='float64')
+        open_day = calendar.searchsorted(pd.DatetimeIndex(ledger['Open date'].iloc[buys]))
+        sale_day = calendar.searchsorted(pd.DatetimeIndex(realized['Close date']))
+        day = np.concatenate([open_day, sale_day])
+        cells.append((k * (n_days + 1) + day) * n_symbols
+                     + code[np.concatenate([buys, realized['lot'].to_numpy()])])
+        deltas.append(np.concatenate([qty[buys], -realized['Qty'].to_numpy()]))
+        flow_cells.append(k * (n_days + 1) + day)
+        invested.append(np.concatenate([qty[buys] * cost[buys], np.zeros(len(realized))]))
+        proceeds.append(np.concatenate([
+            np.zeros(len(buys)), (realized['Qty'] * realized['Sale price per share']).to_numpy()]))
+
+    # events after the calendar end fall in an extra, discarded day
+    def accumulate(index, weights, size):
+        index = np.concatenate(index) if index else np.zeros(0, dtype='int64')
+        weights = np.concatenate(weights) if weights else np.zeros(0)
+        return np.bincount(index, weights=weights, minlength=size)
+
+    qty = accumulate(cells, deltas, n_scenarios * (n_days + 1) * n_symbols)
+    qty = qty.reshape(n_scenarios, n_days + 1, n_symbols)[:, :n_days].cumsum(axis=1)
+    qty[qty <= LOT_EPS] = 0.0
+    value = np.einsum('kds,ds->kd', qty, price)
+    size = n_scenarios * (n_days + 1)
+    invested = accumulate(flow_cells, invested, size).reshape(n_scenarios, -1)[:, :n_days]
+    proceeds = accumulate(flow_cells, proceeds, size).reshape(n_scenarios, -1)[:, :n_days]
+
+    # time weighted daily returns, buys and sales of the day excluded,
+    # at most a total loss when trades are far from the closes
+    previous = np.concatenate([np.zeros((n_scenarios, 1)), value[:, :-1]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_return = np.where(
+            previous > 0, (value - invested + proceeds) / previous - 1, 0.0)
+    daily_return = np.maximum(daily_return, -1.0)
+    index = np.cumprod(1 + daily_return, axis=1)
+    drawdown = (index / np.maximum.accumulate(index, axis=1) - 1).min(axis=1, initial=0.0)
+
+    total_invested = invested.sum(axis=1)
+    total_proceeds = proceeds.sum(axis=1)
+    final = value[:, -1] if n_days else np.zeros(n_scenarios)
+    gain = final + total_proceeds - total_invested
+    scenario = pd.Index(names, name='Scenario')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary = pd.DataFrame({
+            'Final Value': final,
+            'Invested': total_invested,
+            'Proceeds': total_proceeds,
+            'Gain / (Loss)': gain,
+            'Return': gain / total_invested,
+            'Time Weighted Return': index[:, -1] - 1 if n_days else np.zeros(n_scenarios),
+            'Max Drawdown': drawdown,
+        }, index=scenario)
+    values = pd.DataFrame(value.T, index=pd.DatetimeIndex(calendar, name='Date'), columns=scenario)
+    return summary, values
+
+
+def dca_ledger(prices, weights, amount, start, end=None, freq="7D"):
+    """
+    transactions of a dollar cost averaging schedule, bought at the closes 
+    of the price panel.
+
+    Arguments:
+        prices (:obj:`pandas.DataFrame`): price panel.
+        weights (:obj:`dict`): weight of each symbol in each purchase.
+        amount (float): amount invested at each date.
+        start (:obj:`pandas.Timestamp`): first purchase.
+        end (:obj:`pandas.Timestamp`): last possible purchase, default the last panel date.
+        freq (str): frequency of purchases.
+
+    Return:
+        :obj:`pandas.DataFrame`: transactions in the format of the tracker,
+            without the dates where a close is missing.
+    """
+    weights = pd.Series(weights, dtype='float64')
+    weights = weights / weights.sum()
+    dates = pd.date_range(start, prices.index[-1] if end is None else end, freq=freq)
+    closes = prices.reindex(index=dates, columns=weights.index).stack().dropna()
+    ledger = pd.DataFrame({
+        'Open date': closes.index.get_level_values(0),
+        'Type': 'buy',
+        'Symbol': closes.index.get_level_values(1),
+        'Qty': amount * weights.reindex(closes.index.get_level_values(1)).to_numpy() / closes.to_numpy(),
+        'Adj cost per share': closes.to_numpy(),
+    })
+    ledger['Adj cost'] = ledger['Qty'] * ledger['Adj cost per share']
+    return ledger
+
+
+def read_closes(configuration, coin, cache=None):
+    """
+    daily closes of a coin, from its time series stored in `data/ts/`,
+    read through its binary sidecar, see :func:`surfingcrypto.ts_io.read_ts`.
+
+    Arguments:
+        configuration (:obj:`surfingcrypto.config.config`): configuration object.
+        coin (str): coin.
+        cache (dict): closes already read by coin, updated with the new ones.
+
+    Return:
+        :obj:`pandas.Series`: closes indexed by UTC `Date`, named after the coin.
+    """
+    if cache is not None and coin in cache:
+        return cache[coin]
+    df = read_ts(configuration.data_folder+"/ts/"+coin+".csv")
+    closes = df["Close"].astype("float64").rename(coin)
+    closes = closes[~closes.index.duplicated(keep="last")].sort_index()
+    if cache is not None:
+        cache[coin] = closes
+    return closes
+
+
+def load_price_panel(configuration, symbols, calendar, bounds=None, max_workers=8, cache=None):
+    """
+    date × symbol close matrix aligned to `calendar`, from time series 
+    stored in `data/ts/` read in parallel.
+
+    Arguments:
+        configuration (:obj:`surfingcrypto.config.config`): configuration object.
+        symbols (:obj:`list` of :obj:`str`): symbols.
+        calendar (:obj:`pandas.DatetimeIndex`): dates of the panel.
+        bounds (:obj:`dict` of :obj:`dict`): `start` and `end_day` of the closes 
+            of each symbol, eg. `coinbase_req` of the configuration.
+        max_workers (int): number of time series read in parallel.
+        cache (dict): closes already read by coin, see :func:`read_closes`.
+
+    Return:
+        panel (:obj:`pandas.DataFrame`): closes indexed by date, one column 
+            per symbol, `NaN` where missing.
+        errors (:obj:`list` of :obj:`dict`): `symbol` and `error` of the 
+            symbols that could not be loaded.
+    """
+    def load(symbol):
+        closes = read_closes(configuration, symbol, cache)
+        if bounds is not None:
+            closes = closes.loc[bounds[symbol]["start"]:bounds[symbol]["end_day"]]
+        return closes
+
+    columns, errors = {}, []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {symbol: executor.submit(load, symbol) for symbol in symbols}
+    for symbol, future in futures.items():
+        try:
+            columns[symbol] = future.result().reindex(calendar)
+        except Exception as e:
+            errors.append({"symbol": symbol, "error": e})
+    panel = pd.DataFrame(columns, index=pd.DatetimeIndex(calendar, name="Date"))
+    return panel, errors
+
+
+def compact_frame(df, float32=False, drop=None):
+    """
+    reduces the memory of a tracker frame, storing `Symbol` and `Type`
+    as categoricals and optionally dropping columns and downcasting 
+    derived metrics to float32.
+
+    Arguments:
+        df (:obj:`pandas.DataFrame`): transactions, open lots or results.
+        float32 (bool): store float64 columns as float32, except the ones
+            of the transactions (:data:`LEDGER_COLUMNS`).
+        drop (:obj:`list` of :obj:`str`): columns to drop, also when
+            suffixed by a benchmark name.
+
+    Return:
+        :obj:`pandas.DataFrame`: compacted frame.
+    """
+    if drop:
+        df = df.drop(columns=[
+            c for c in df.columns if any(c == d or c.startswith(d + ' ') for d in drop)
+        ])
+    dtypes = {
+        c: 'category' for c in CATEGORICAL_COLUMNS
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)
+    }
+    if float32:
+        dtypes.update({
+            c: 'float32' for c in df.columns
+            if df[c].dtype == 'float64' and c not in LEDGER_COLUMNS
+        })
+    return df.astype(dtypes) if dtypes else df
+
+
+def lookup(panel, dates, symbols):
+    """
+    values of a panel at each (date, symbol) pair, `NaN` if missing.
+    """
+    rows = panel.index.get_indexer(dates)
+    columns = panel.columns.get_indexer(symbols)
+    found = (rows >= 0) & (columns >= 0)
+    values = np.full(len(rows), np.nan)
+    values[found] = panel.to_numpy(dtype='float64')[rows[found], columns[found]]
+    return values
+
+
+def lots_portfolio_calcs(portfolio, benchmark, adj_close, start_date):
+    """
+    returns of open lots compared to the benchmark, 
+    adding the computed columns to `portfolio` in place.
+    """
+    portfolio = modified_cost_per_share(portfolio, adj_close, start_date)
+    portfolio = portfolio_end_of_year_stats(portfolio, adj_close)
+    portfolio = portfolio_start_of_year_stats(portfolio, adj_close)
+    portfolio = calc_returns(portfolio)
+    return benchmark_portfolio_calcs(portfolio, benchmark)
 
 
 # matches prices of each asset to open date, then adjusts for  cps of dates
 def modified_cost_per_share(portfolio, adj_close, start_date):
-    df = pd.merge(portfolio, adj_close, left_on=['Date Snapshot', 'Symbol'],
-                  right_on=['Date', 'symbol'], how='left')
-    df.rename(columns={'Close': 'Symbol Adj Close'}, inplace=True)
-    df['Adj cost daily'] = df['Symbol Adj Close'] * df['Qty']
-    df = df.drop(['symbol', 'Date'], axis=1)
-    return df
-
-
-# merge portfolio data with latest benchmark data and create several calcs
-def benchmark_portfolio_calcs(portfolio, benchmark):
-    portfolio = pd.merge(portfolio, benchmark, left_on=['Date Snapshot'],
-                         right_on=['Date'], how='left')
-    portfolio = portfolio.drop(['Date'], axis=1)
-    portfolio.rename(columns={'Close': 'Benchmark Close'}, inplace=True)
-    benchmark_max = benchmark[benchmark['Date'] == benchmark['Date'].max()]
-    portfolio['Benchmark End Date Close'] = portfolio.apply(lambda x: benchmark_max['Close'], axis=1)
-    benchmark_min = benchmark[benchmark['Date'] == benchmark['Date'].min()]
-    portfolio['Benchmark Start Date Close'] = portfolio.apply(lambda x: benchmark_min['Close'], axis=1)
+    portfolio['Symbol Adj Close'] = lookup(adj_close, portfolio['Date Snapshot'], portfolio['Symbol'])
+    portfolio['Adj cost daily'] = portfolio['Symbol Adj Close'] * portfolio['Qty']
     return portfolio
 
 
+def benchmark_suffixes(benchmark):
+    """
+    suffixes of the benchmark columns: none for a single benchmark 
+    (:obj:`pandas.Series`), the benchmark name for each column of a 
+    :obj:`pandas.DataFrame`, eg. `Benchmark Return BTC`.
+    """
+    if isinstance(benchmark, pd.Series):
+        return ['']
+    return [' ' + str(name) for name in benchmark.columns]
+
+
+def benchmark_names(benchmark):
+    """
+    names of the benchmarks: the name of a single benchmark
+    (:obj:`pandas.Series`), or the columns of a :obj:`pandas.DataFrame`.
+    """
+    if isinstance(benchmark, pd.Series):
+        return [None if benchmark.name is None else str(benchmark.name)]
+    return [str(name) for name in benchmark.columns]
+
+
+def calc_columns(benchmark):
+    """
+    number of float columns of each row of the portfolio calculations, 
+    growing with the number of benchmarks.
+    """
+    return (len(HOLDINGS_FIELDS) + len(SYMBOL_COLUMNS)
+            + len(BENCHMARK_COLUMNS) * len(benchmark_suffixes(benchmark)))
+
+
+# adds benchmark data and computes the comparison with each benchmark
+def benchmark_portfolio_calcs(portfolio, benchmark, benchmark_start=None):
+    """
+    comparison of the holdings with one or more benchmarks, computed 
+    in one pass on rows × benchmarks arrays.
+
+    Arguments:
+        portfolio (:obj:`pandas.DataFrame`): holdings with `Adj cost`, 
+            `symbol Share Value` and `symbol Return`.
+        benchmark (:obj:`pandas.Series` or :obj:`pandas.DataFrame`): benchmark 
+            closes by date, one column per benchmark.
+        benchmark_start (float or :obj:`pandas.Series`): start date close 
+            of the benchmarks, default their first close.
+
+    Return:
+        :obj:`pandas.DataFrame`: `portfolio` with the benchmark columns,
+            suffixed as in :func:`benchmark_suffixes`.
+    """
+    suffixes = benchmark_suffixes(benchmark)
+    closes = benchmark.to_frame() if isinstance(benchmark, pd.Series) else benchmark
+    close = closes.reindex(portfolio['Date Snapshot']).to_numpy(dtype='float64')
+    start = closes.iloc[0] if benchmark_start is None else benchmark_start
+    start = np.broadcast_to(np.asarray(start, dtype='float64'), (len(suffixes),))
+    end = closes.iloc[-1].to_numpy(dtype='float64')
+    cost = portfolio['Adj cost'].to_numpy()[:, None]
+
+    shares = cost / start
+    start_cost = shares * start
+    value = shares * close
+    benchmark_return = close / start - 1
+    abs_value_compare = portfolio['symbol Share Value'].to_numpy()[:, None] - start_cost
+    columns = {
+        'Benchmark Close': close,
+        'Benchmark End Date Close': np.broadcast_to(end, close.shape),
+        'Benchmark Start Date Close': np.broadcast_to(start, close.shape),
+        'Equiv Benchmark Shares': shares,
+        'Benchmark Start Date Cost': start_cost,
+        'Benchmark Return': benchmark_return,
+        'Benchmark Share Value': value,
+        'Benchmark Gain / (Loss)': value - cost,
+        'Abs Value Compare': abs_value_compare,
+        'Abs Value Return': abs_value_compare / start_cost,
+        'Abs. Return Compare': portfolio['symbol Return'].to_numpy()[:, None] - benchmark_return,
+    }
+    for name in BENCHMARK_COLUMNS:
+        portfolio[[name + suffix for suffix in suffixes]] = columns[name]
+    return portfolio
+
+
+def equal_weight_index(closes, name="Equal weight"):
+    """
+    equal weight index of some coins, bought at their first close.
+
+    Arguments:
+        closes (:obj:`pandas.DataFrame`): closes by date, one column per coin.
+        name (str): name of the index.
+
+    Return:
+        :obj:`pandas.Series`: value of the index, starting from 1.
+    """
+    return (closes / closes.bfill().iloc[0]).mean(axis=1).rename(name)
+
+
 def portfolio_end_of_year_stats(portfolio, adj_close_end):
-    adj_close_end = adj_close_end[adj_close_end['Date'] == adj_close_end['Date'].max()]
-    portfolio_end_data = pd.merge(portfolio, adj_close_end, left_on='Symbol',
-                                  right_on='symbol')
-    portfolio_end_data.rename(columns={'Close': 'symbol End Date Close'}, inplace=True)
-    portfolio_end_data = portfolio_end_data.drop(['symbol', 'Date'], axis=1)
-    return portfolio_end_data
+    portfolio['symbol End Date Close'] = adj_close_end.iloc[-1].reindex(portfolio['Symbol']).to_numpy()
+    return portfolio
 
 
-# Merge the overall dataframe with the adj close start of year dataframe for YTD tracking of tickers.
+# adds the adj close at start for YTD tracking of tickers.
 def portfolio_start_of_year_stats(portfolio, adj_close_start):
-    adj_close_start = adj_close_start[adj_close_start['Date'] == adj_close_start['Date'].min()]
-    portfolio_start = pd.merge(portfolio, adj_close_start[['symbol', 'Close', 'Date']],
-                                    left_on='Symbol', right_on='symbol')
-    portfolio_start.rename(columns={'Close': 'symbol Start Date Close'}, inplace=True)
-    portfolio_start['Adj cost per share'] = np.where(portfolio_start['Open date'] <= portfolio_start['Date'],
-                                                          portfolio_start['symbol Start Date Close'],
-                                                          portfolio_start['Adj cost per share'])
-    portfolio_start['Adj cost'] = portfolio_start['Adj cost per share'] * portfolio_start['Qty']
-    portfolio_start = portfolio_start.drop(['symbol', 'Date'], axis=1)
-    portfolio_start['Equiv Benchmark Shares'] = portfolio_start['Adj cost'] / portfolio_start['Benchmark Start Date Close']
-    portfolio_start['Benchmark Start Date Cost'] = portfolio_start['Equiv Benchmark Shares'] * portfolio_start['Benchmark Start Date Close']
-    return portfolio_start
+    start = adj_close_start.iloc[0]
+    portfolio['symbol Start Date Close'] = start.reindex(portfolio['Symbol']).to_numpy()
+    portfolio['Adj cost per share'] = np.where(portfolio['Open date'] <= adj_close_start.index[0],
+                                                          portfolio['symbol Start Date Close'],
+                                                          portfolio['Adj cost per share'])
+    portfolio['Adj cost'] = portfolio['Adj cost per share'] * portfolio['Qty']
+    return portfolio
 
 
 def calc_returns(portfolio):
-    portfolio['Benchmark Return'] = portfolio['Benchmark Close'] / portfolio['Benchmark Start Date Close'] - 1
     portfolio['symbol Return'] = portfolio['Symbol Adj Close'] / portfolio['Adj cost per share'] - 1
     portfolio['symbol Share Value'] = portfolio['Qty'] * portfolio['Symbol Adj Close']
-    portfolio['Benchmark Share Value'] = portfolio['Equiv Benchmark Shares'] * portfolio['Benchmark Close']
     portfolio['Stock Gain / (Loss)'] = portfolio['symbol Share Value'] - portfolio['Adj cost']
-    portfolio['Benchmark Gain / (Loss)'] = portfolio['Benchmark Share Value'] - portfolio['Adj cost']
-    portfolio['Abs Value Compare'] = portfolio['symbol Share Value'] - portfolio['Benchmark Start Date Cost']
-    portfolio['Abs Value Return'] = portfolio['Abs Value Compare']/portfolio['Benchmark Start Date Cost']
-    portfolio['Abs. Return Compare'] = portfolio['symbol Return'] - portfolio['Benchmark Return']
     return portfolio
 
 
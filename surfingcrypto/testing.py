@@ -0,0 +1,281 @@
+"""
+offline stand-in for `coinbase.wallet.client.Client`.
+
+Serves accounts and transactions held in memory with the same
+pagination contract of the coinbase API, so that `surfingcrypto.coinbase`
+can be tested and benchmarked without network access.
+Synthetic transactions are generated lazily, page by page, so that 
+portfolios with millions of transactions fit in memory.
+"""
+import datetime
+import random
+import threading
+import time
+from collections import Counter
+
+from coinbase.wallet.model import APIObject, new_api_object
+
+from surfingcrypto.coinbase import DETAIL_TYPES
+
+
+class FakeClient:
+    """
+    Fake coinbase client.
+
+    Arguments:
+        accounts (:obj:`list` of :obj:`dict`): accounts as returned by the API,
+            each one with an additional `transactions` key holding
+            its transactions sorted newest first.
+        details (:obj:`dict`): buy/sell/deposit/withdrawal resources
+            keyed by their id, synthesized from the id if missing.
+        latency (float): seconds each API call sleeps before answering.
+        prices (:obj:`dict`): spot price of each currency, in any quote 
+            currency, default 10 for the currencies of the accounts.
+
+    Attributes:
+        calls (:obj:`collections.Counter`): number of calls per API method.
+    """
+
+    def __init__(self, accounts=None, details=None, latency=0.0, prices=None):
+        self._accounts = []
+        self._transactions = {}
+        for account in accounts or []:
+            account = dict(account)
+            self._transactions[account["id"]] = account.pop("transactions", [])
+            self._accounts.append(account)
+        self._details = details or {}
+        self.prices = prices or {a["currency"]: 10.0 for a in self._accounts}
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def synthetic(cls, n_accounts=500, n_transactions=1000000, empty_share=0.3,
+                  latency=0.0, seed=0):
+        """
+        builds a fake client serving a synthetic portfolio.
+
+        Arguments:
+            n_accounts (int): number of wallet accounts.
+            n_transactions (int): total number of transactions, spread 
+                unevenly over the non-empty accounts.
+            empty_share (float): share of accounts without transactions.
+            latency (float): seconds each API call sleeps before answering.
+            seed (int): seed of the random generator.
+        """
+        rng = random.Random(seed)
+        n_empty = int(n_accounts * empty_share)
+        active = rng.sample(range(n_accounts), n_accounts - n_empty)
+        weights = [rng.paretovariate(1.5) for _ in active]
+        counts = dict.fromkeys(range(n_accounts), 0)
+        for i, weight in zip(active, weights):
+            counts[i] = int(n_transactions * weight / sum(weights))
+        if active:
+            # rounding leftovers go to the first active account
+            counts[active[0]] += n_transactions - sum(counts.values())
+        accounts = []
+        for i in range(n_accounts):
+            account = make_account(i, 0)
+            account["transactions"] = SyntheticTransactions(
+                account["id"], account["currency"], counts[i]
+                )
+            accounts.append(account)
+        return cls(accounts, latency=latency)
+
+    def add_transaction(self, account_id, transaction):
+        """
+        records a new transaction, newest first.
+        """
+        self._transactions[account_id].insert(0, transaction)
+
+    def _count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _page(self, items, limit=25, starting_after=None, **params):
+        start = 0
+        if starting_after is not None:
+            if isinstance(items, SyntheticTransactions):
+                start = items.index_of(starting_after) + 1
+            else:
+                start = [item["id"] for item in items].index(starting_after) + 1
+        page = list(items[start:start + limit])
+        if start + limit < len(items):
+            next_starting_after = page[-1]["id"]
+        else:
+            next_starting_after = None
+        pagination = {"limit": limit, "next_starting_after": next_starting_after}
+        obj = APIObject(self, pagination=new_api_object(None, pagination, APIObject))
+        obj.data = new_api_object(self, page)
+        return obj
+
+    def get_current_user(self, **params):
+        self._count("get_current_user")
+        return new_api_object(self, {"id": "fake-user", "resource": "user"})
+
+    def get_accounts(self, **params):
+        self._count("get_accounts")
+        return self._page(self._accounts, **params)
+
+    def get_account(self, account_id, **params):
+        self._count("get_account")
+        for account in self._accounts:
+            if account["id"] == account_id:
+                return new_api_object(self, account)
+        raise KeyError(account_id)
+
+    def get_transactions(self, account_id, **params):
+        self._count("get_transactions")
+        transactions = self._transactions[account_id]
+        if params.pop("order", "desc") == "asc":
+            transactions = transactions[::-1]
+        return self._page(transactions, **params)
+
+    def get_exchange_rates(self, **params):
+        self._count("get_exchange_rates")
+        rates = {c: str(1 / p) for c, p in self.prices.items()}
+        return new_api_object(self, {"currency": params.get("currency", "USD"), "rates": rates})
+
+    def get_spot_price(self, **params):
+        self._count("get_spot_price")
+        base, currency = params["currency_pair"].split("-")
+        return new_api_object(
+            self, {"base": base, "currency": currency, "amount": str(self.prices[base])})
+
+    def _get_detail(self, method, resource_id):
+        self._count(method)
+        if resource_id in self._details:
+            return new_api_object(self, self._details[resource_id])
+        return new_api_object(self, make_detail(resource_id))
+
+    def get_buy(self, account_id, buy_id, **params):
+        return self._get_detail("get_buy", buy_id)
+
+    def get_sell(self, account_id, sell_id, **params):
+        return self._get_detail("get_sell", sell_id)
+
+    def get_deposit(self, account_id, deposit_id, **params):
+        return self._get_detail("get_deposit", deposit_id)
+
+    def get_withdrawal(self, account_id, withdrawal_id, **params):
+        return self._get_detail("get_withdrawal", withdrawal_id)
+
+
+def make_account(i, n_transactions, currency=None, transaction_type="send"):
+    """
+    builds a fake account with `n_transactions` transactions of given type, newest first.
+    """
+    account_id = f"account-{i}"
+    transactions = []
+    for j in reversed(range(n_transactions)):
+        transaction = {
+            "id": f"{account_id}-tx-{j}",
+            "resource": "transaction",
+            "type": transaction_type,
+            "created_at": (datetime.datetime(2021, 1, 1) + datetime.timedelta(seconds=j)
+                           ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "amount": {"amount": "1.0", "currency": currency or f"C{i}"},
+            "native_amount": {"amount": "10.0", "currency": "EUR"},
+        }
+        if transaction_type in DETAIL_TYPES:
+            transaction[transaction_type] = {"id": f"{account_id}-{transaction_type}-{j}"}
+        transactions.append(transaction)
+    return {
+        "id": account_id,
+        "resource": "account",
+        "currency": currency or f"C{i}",
+        "balance": {"amount": "1.0", "currency": currency or f"C{i}"},
+        "native_balance": {"amount": "10.00", "currency": "EUR"},
+        "transactions": transactions,
+    }
+
+
+def make_detail(resource_id, fee="0.15"):
+    """
+    builds a completed buy/sell/deposit/withdrawal resource.
+    """
+    return {
+        "id": resource_id,
+        "status": "completed",
+        "amount": {"amount": "10.0", "currency": "EUR"},
+        "total": {"amount": "10.0", "currency": "EUR"},
+        "subtotal": {"amount": "9.85", "currency": "EUR"},
+        "fees": [{"amount": {"amount": fee, "currency": "EUR"}}],
+    }
+
+
+def make_details(accounts, fee="0.15"):
+    """
+    builds the buy/sell/deposit/withdrawal resources referenced by the
+    transactions of fake accounts.
+    """
+    details = {}
+    for account in accounts:
+        for transaction in account["transactions"]:
+            if transaction["type"] in DETAIL_TYPES:
+                resource_id = transaction[transaction["type"]]["id"]
+                details[resource_id] = make_detail(resource_id, fee)
+    return details
+
+
+class SyntheticTransactions:
+    """
+    Lazy, read-only sequence of synthetic transactions of an account,
+    newest first (or oldest first if `ascending`).
+
+    Transactions are built from their chronological index when accessed.
+    """
+
+    #: cycle of transaction types, weighted towards buys
+    TYPES = ["buy", "buy", "send", "buy", "sell", "fiat_deposit", "buy", "sell",
+             "send", "fiat_withdrawal"]
+    START = datetime.datetime(2018, 1, 1)
+
+    def __init__(self, account_id, currency, n, ascending=False):
+        self.account_id = account_id
+        self.currency = currency
+        self.n = n
+        self.ascending = ascending
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step == -1 and key.start is None and key.stop is None:
+                return SyntheticTransactions(
+                    self.account_id, self.currency, self.n, not self.ascending
+                    )
+            return [self[i] for i in range(*key.indices(self.n))]
+        if key < 0:
+            key += self.n
+        if not 0 <= key < self.n:
+            raise IndexError(key)
+        return self._transaction(key if self.ascending else self.n - 1 - key)
+
+    def index_of(self, transaction_id):
+        """
+        position of a transaction in this sequence, from its id.
+        """
+        k = int(transaction_id.rsplit("-", 1)[1])
+        return k if self.ascending else self.n - 1 - k
+
+    def _transaction(self, k):
+        transaction_type = self.TYPES[k % len(self.TYPES)]
+        sign = -1 if transaction_type in ["sell", "fiat_withdrawal"] or k % 4 == 2 else 1
+        created_at = self.START + datetime.timedelta(minutes=7 * k)
+        transaction = {
+            "id": f"{self.account_id}-tx-{k}",
+            "resource": "transaction",
+            "type": transaction_type,
+            "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "amount": {"amount": str(sign * (1 + k % 5) / 10), "currency": self.currency},
+            "native_amount": {"amount": str(sign * (1 + k % 5)), "currency": "EUR"},
+        }
+        if transaction_type in DETAIL_TYPES:
+            transaction[transaction_type] = {
+                "id": f"{self.account_id}-{transaction_type}-{k}"
+                }
+        return transaction
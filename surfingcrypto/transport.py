@@ -0,0 +1,227 @@
+"""
+HTTP transport layer of the coinbase client.
+"""
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+#: requests per second allowed by coinbase API (10.000 requests per hour per key)
+COINBASE_RATE_LIMIT=10000/3600
+
+#: requests allowed by coinbase API in one hour
+COINBASE_HOURLY_LIMIT=10000
+
+#: default burst of requests of a session, a few seconds worth of `COINBASE_RATE_LIMIT`
+COINBASE_BURST=10
+
+#: status codes of responses that are retried
+RETRY_STATUS=[429,500,502,503,504]
+
+_ID=re.compile(r"^[0-9a-fA-F-]{16,}$")
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the rate of requests to the coinbase API.
+
+    Arguments:
+        rate (float): tokens (requests) replenished per second.
+        capacity (int): maximum burst of requests allowed at once.
+    """
+
+    def __init__(self,rate=COINBASE_RATE_LIMIT,capacity=10):
+        self.rate=rate
+        self.capacity=capacity
+        self._tokens=capacity
+        self._last=time.monotonic()
+        self._lock=threading.Lock()
+
+    def acquire(self):
+        """
+        blocks until a token is available, then consumes it.
+        """
+        while True:
+            with self._lock:
+                now=time.monotonic()
+                self._tokens=min(self.capacity,self._tokens+(now-self._last)*self.rate)
+                self._last=now
+                if self._tokens>=1:
+                    self._tokens-=1
+                    return
+                wait=(1-self._tokens)/self.rate
+            time.sleep(wait)
+
+
+class EndpointMetrics:
+    """
+    Thread-safe latency and error metrics of requests, per endpoint.
+
+    Endpoints are identified by method and path, with resource ids replaced
+    by `{id}`, eg. `GET /v2/accounts/{id}/transactions`.
+    """
+
+    def __init__(self):
+        self._metrics={}
+        self._lock=threading.Lock()
+
+    def record(self,endpoint,latency,error=False,retry=False):
+        """
+        records a request.
+
+        Arguments:
+            endpoint (str): endpoint of the request.
+            latency (float): seconds elapsed until the response.
+            error (bool): the request failed (connection error or non 2XX status).
+            retry (bool): the request is going to be retried.
+        """
+        with self._lock:
+            m=self._metrics.setdefault(endpoint,{
+                "calls":0,"errors":0,"retries":0,"total_latency":0.0,"max_latency":0.0
+            })
+            m["calls"]+=1
+            m["errors"]+=int(error)
+            m["retries"]+=int(retry)
+            m["total_latency"]+=latency
+            m["max_latency"]=max(m["max_latency"],latency)
+
+    def summary(self):
+        """
+        summary of metrics.
+
+        Return:
+            :obj:`pandas.DataFrame`: calls, errors, retries and latencies by endpoint.
+        """
+        with self._lock:
+            df=pd.DataFrame.from_dict(self._metrics,orient="index")
+        if len(df)==0:
+            return df
+        df["mean_latency"]=df["total_latency"]/df["calls"]
+        df.index.name="endpoint"
+        return df.sort_index()
+
+    def reset(self):
+        """
+        clears all metrics.
+        """
+        with self._lock:
+            self._metrics={}
+
+
+def endpoint(method,url):
+    """
+    endpoint of a request, with resource ids replaced by `{id}`.
+    """
+    path="/".join(
+        "{id}" if _ID.match(part) else part for part in urlsplit(url).path.split("/")
+        )
+    return method.upper()+" "+path
+
+
+class TransportSession(requests.Session):
+    """
+    `requests.Session` for the coinbase client with a pool of keep-alive
+    connections sized for parallel use, a shared token bucket rate limiter and
+    retries with exponential backoff and full jitter on throttling (429) and
+    server errors.
+
+    Note:
+        The default rate limiter allows bursts of a few requests only
+        and replenishes them at the average rate allowed by the coinbase API,
+        so that sessions can not exceed the hourly budget.
+
+    Arguments:
+        rate (float): requests per second, `None` disables rate limiting.
+        capacity (int): maximum burst of requests.
+        pool_size (int): maximum number of pooled connections per host.
+        max_retries (int): maximum number of retries of a request.
+        backoff_base (float): seconds of the first backoff, doubled at every retry.
+        backoff_max (float): maximum seconds of a backoff, also of the
+            waits requested by `Retry-After` headers.
+
+    Attributes:
+        rate_limiter (:obj:`surfingcrypto.transport.RateLimiter`): shared rate limiter.
+        metrics (:obj:`surfingcrypto.transport.EndpointMetrics`): per-endpoint metrics.
+    """
+
+    def __init__(self,
+            rate=COINBASE_RATE_LIMIT,
+            capacity=COINBASE_BURST,
+            pool_size=32,
+            max_retries=5,
+            backoff_base=0.5,
+            backoff_max=30.0
+        ):
+        super().__init__()
+        adapter=HTTPAdapter(pool_connections=pool_size,pool_maxsize=pool_size)
+        self.mount("https://",adapter)
+        self.mount("http://",adapter)
+        self.rate_limiter=None if rate is None else RateLimiter(rate,capacity)
+        self.metrics=EndpointMetrics()
+        self.max_retries=max_retries
+        self.backoff_base=backoff_base
+        self.backoff_max=backoff_max
+
+    def backoff(self,attempt,response=None):
+        """
+        seconds to wait before retrying, from the `Retry-After` header if
+        present, otherwise random between 0 and the exponential backoff,
+        at most `backoff_max`.
+        """
+        if response is not None and response.headers.get("Retry-After","").isdigit():
+            return min(float(response.headers["Retry-After"]),self.backoff_max)
+        return random.uniform(0,min(self.backoff_max,self.backoff_base*2**attempt))
+
+    def request(self,method,url,*args,**kwargs):
+        """
+        sends a request through the rate limiter, retrying it if needed.
+        """
+        name=endpoint(method,url)
+        attempt=0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            retry=attempt<self.max_retries
+            t=time.perf_counter()
+            try:
+                response=super().request(method,url,*args,**kwargs)
+            except (requests.ConnectionError,requests.Timeout):
+                self.metrics.record(name,time.perf_counter()-t,error=True,retry=retry)
+                if not retry:
+                    raise
+                time.sleep(self.backoff(attempt))
+            else:
+                error=not 200<=response.status_code<300
+                retry=retry and response.status_code in RETRY_STATUS
+                self.metrics.record(name,time.perf_counter()-t,error=error,retry=retry)
+                if not retry:
+                    return response
+                time.sleep(self.backoff(attempt,response))
+            attempt+=1
+
+
+def install_transport(client,transport=None):
+    """
+    replaces the session of a coinbase client with a `TransportSession`,
+    keeping its authentication and headers.
+
+    Arguments:
+        client (:obj:`coinbase.wallet.client.Client`): coinbase client.
+        transport (:obj:`surfingcrypto.transport.TransportSession`): transport
+            to install, default a new one.
+
+    Return:
+        transport (:obj:`surfingcrypto.transport.TransportSession`): installed transport.
+    """
+    if transport is None:
+        transport=TransportSession()
+    transport.auth=client.session.auth
+    transport.headers.update(client.session.headers)
+    client.session.close()
+    client.session=transport
+    return transport
@@ -4,6 +4,8 @@ import mplfinance as mplf
 import matplotlib.pyplot as plt
 import pandas_ta as ta
 
+from surfingcrypto.ts_io import read_ts
+
 #warning di mplfinance per too many data in candlestick plot
 import warnings
 warnings.filterwarnings("ignore")
@@ -36,11 +38,10 @@ class TS:
 
     def build_ts(self):
         """
-        reads the data from data stored locally in `data/ts/` and saved in .csv format.
+        reads the data from data stored locally in `data/ts/` and saved in .csv format,
+        through its binary sidecar if up to date, see :func:`surfingcrypto.ts_io.read_ts`.
         """
-        self.df=pd.read_csv(self.config.data_folder+"/ts/"+self.coin+".csv")
-        self.df["Date"]=pd.to_datetime(self.df["Date"],utc=True)
-        self.df.set_index("Date",inplace=True)
+        self.df=read_ts(self.config.data_folder+"/ts/"+self.coin+".csv")
 
     def percentage_diff(self,window=7):
         """
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+#: key of the source file stat in the metadata of the binary sidecars of time series
+SIDECAR_KEY=b"surfingcrypto.source"
+
+
+def read_ts(path,sidecar=True):
+    """
+    reads a time series stored in .csv format, indexed by UTC `Date`.
+
+    The parsed time series is kept in an uncompressed Feather sidecar 
+    next to the .csv file (eg. `data/ts/BTC.feather`), together with the 
+    size and modification time of the .csv file. Following reads 
+    memory-map the sidecar instead of parsing the .csv file again, 
+    until the .csv file changes.
+
+    Arguments:
+        path (str): path to .csv file.
+        sidecar (bool): use and write the binary sidecar.
+
+    Return:
+        :obj:`pandas.DataFrame`: time series.
+    """
+    stat=os.stat(path)
+    source=json.dumps({"size":stat.st_size,"mtime_ns":stat.st_mtime_ns}).encode()
+    cache=os.path.splitext(path)[0]+".feather"
+    if sidecar and os.path.isfile(cache):
+        try:
+            table=feather.read_table(cache,memory_map=True)
+            if (table.schema.metadata or {}).get(SIDECAR_KEY)==source:
+                return table.to_pandas()
+        except (OSError,pa.ArrowInvalid):
+            pass
+
+    df=pd.read_csv(path)
+    df["Date"]=pd.to_datetime(df["Date"],utc=True)
+    df.set_index("Date",inplace=True)
+
+    if sidecar:
+        table=pa.Table.from_pandas(df)
+        table=table.replace_schema_metadata({**table.schema.metadata,SIDECAR_KEY:source})
+        try:
+            feather.write_feather(table,cache+".tmp",compression="uncompressed")
+            os.replace(cache+".tmp",cache)
+        except OSError:
+            pass
+    return df
@@ -2,6 +2,7 @@ import pytest
 from pathlib import Path
 import shutil
 import os
+from types import SimpleNamespace
 
 ##### MARKS #############################
 
@@ -23,3 +24,14 @@ def temp_test_env(request,tmp_path):
             TEST_DATA/p,
             tmp_path/"config"/p)
     return tmp_path
+
+@pytest.fixture
+def fake_configuration(tmp_path):
+    """
+    minimal configuration object carrying fake coinbase credentials.
+    """
+    return SimpleNamespace(
+        config={"coinbase":{"key":"fake-key","scrt":"fake-secret"}},
+        config_folder=str(tmp_path),
+        data_folder=str(tmp_path),
+        )
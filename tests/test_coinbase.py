@@ -3,6 +3,9 @@ from surfingcrypto.coinbase import CB, MyCoinbase
 from surfingcrypto.config import config
 from coinbase.wallet.client import Client
 import pytest
+from unittest.mock import patch
+
+from surfingcrypto.testing import FakeClient, make_account
 ## ?!? disable  unittest/suite.py:107: ResourceWarning: unclosed <ssl.SSLSocket 
 @pytest.mark.skip
 class TestCB(unittest.TestCase):
@@ -41,4 +44,100 @@ class TestCB(unittest.TestCase):
         pass
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+
+########## OFFLINE TESTS
+
+
+def make_cb(configuration, client):
+    with patch("surfingcrypto.coinbase.Client", return_value=client):
+        return CB(configuration)
+
+
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_get_all_accounts_with_transactions_modes(fake_configuration, max_workers):
+    accounts = [make_account(i, n) for i, n in enumerate([3, 0, 250, 1, 0, 120])]
+    cb = make_cb(fake_configuration, FakeClient(accounts))
+    progress = []
+    has_transactions, timeranges = cb.get_all_accounts_with_transactions(
+        max_workers=max_workers,
+        requests_per_second=None,
+        callback=lambda done, total, account: progress.append((done, total)),
+    )
+    assert [a["id"] for a in has_transactions] == [
+        "account-0", "account-2", "account-3", "account-5"
+        ]
+    assert timeranges[1] == {0: "2021-01-01T00:04:09Z", 1: "2021-01-01T00:00:00Z"}
+    assert sorted(progress) == [(i, 6) for i in range(1, 7)]
+
+
+def test_iter_transactions_stops_early(fake_configuration):
+    client = FakeClient([make_account(0, 250)])
+    cb = make_cb(fake_configuration, client)
+    account = cb.get_accounts()[0]
+    client.calls.clear()
+    it = cb.iter_transactions(account, prefetch=False)
+    first = [next(it) for _ in range(5)]
+    it.close()
+    assert [t["id"] for t in first] == [f"account-0-tx-{j}" for j in range(249, 244, -1)]
+    assert client.calls["get_transactions"] == 1
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_iter_transactions_matches_list(fake_configuration, prefetch):
+    client = FakeClient([make_account(0, 250)])
+    cb = make_cb(fake_configuration, client)
+    account = cb.get_accounts()[0]
+    streamed = [t["id"] for t in cb.iter_transactions(account, prefetch=prefetch)]
+    assert streamed == [t["id"] for t in cb.get_transactions(account)]
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_probe_timeranges(fake_configuration, max_workers):
+    client = FakeClient([make_account(i, n) for i, n in enumerate([3, 0, 250, 1])])
+    cb = make_cb(fake_configuration, client)
+    expected = cb.get_all_accounts_with_transactions()
+    client.calls.clear()
+    probed = cb.get_all_accounts_with_transactions(
+        max_workers=max_workers, requests_per_second=None, probe=True
+        )
+    assert [a["id"] for a in probed[0]] == [a["id"] for a in expected[0]]
+    assert probed[1] == expected[1]
+    # two probes per account with transactions, one for the empty one
+    assert client.calls["get_transactions"] == 7
+
+
+def test_synthetic_client_scan(fake_configuration):
+    client = FakeClient.synthetic(n_accounts=20, n_transactions=3000, seed=1)
+    cb = make_cb(fake_configuration, client)
+    full = cb.get_all_accounts_with_transactions()
+    probed = cb.get_all_accounts_with_transactions(probe=True)
+    assert len(full[0]) == 14
+    assert full[1] == probed[1]
+    transactions = [cb.get_transactions(account) for account in full[0]]
+    assert sum(len(t) for t in transactions) == 3000
+    assert all(len({tx["id"] for tx in t}) == len(t) for t in transactions)
+
+
+def test_benchmark_run():
+    from benchmarks.bench_coinbase import run, STAGES
+    results = run(accounts=5, transactions=200)
+    assert [r["stage"] for r in results] == STAGES
+    warm = {r["stage"]: r["api_calls"] for r in results}
+    assert warm["history_incremental_warm"] < warm["history_incremental_cold"]
+
+
+@pytest.mark.parametrize("n,strategy,calls", [
+    (5, "auto", {"get_account": 5}),
+    (60, "auto", {"get_accounts": 3}),
+    (60, "concurrent", {"get_account": 60}),
+    (5, "sweep", {"get_accounts": 3}),
+    ])
+def test_get_accounts_from_list(fake_configuration, n, strategy, calls):
+    client = FakeClient([make_account(i, 0) for i in range(250)])
+    cb = make_cb(fake_configuration, client)
+    dumped = [{"account_id": f"account-{i}"} for i in range(249, 249 - 4 * n, -4)]
+    client.calls.clear()
+    accounts = cb.get_accounts_from_list(dumped, strategy=strategy)
+    assert [a["id"] for a in accounts] == [d["account_id"] for d in dumped]
+    assert dict(client.calls) == calls
@@ -1,8 +1,14 @@
 import unittest 
-from surfingcrypto.coinbase import MyCoinbase 
+from surfingcrypto.coinbase import MyCoinbase, AsyncMyCoinbase, FxTable, read_history
 from surfingcrypto.config import config
 import pytest
+import numpy as np
 import pandas as pd
+import os
+import asyncio
+from unittest.mock import patch
+
+from surfingcrypto.testing import FakeClient, make_account, make_details
 @pytest.mark.skip
 class TestMyCoinbase_active_accounts(unittest.TestCase):
 
@@ -44,4 +50,155 @@ class TestMyCoinbase_historic_accounts(unittest.TestCase):
             )
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+
+########## OFFLINE TESTS
+
+def make_mycoinbase(configuration, client, **kwargs):
+    with patch("surfingcrypto.coinbase.Client", return_value=client):
+        return MyCoinbase(configuration=configuration, **kwargs)
+
+
+def test_incremental_history(fake_configuration):
+    client = FakeClient([make_account(i, n) for i, n in enumerate([150, 2, 0])])
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    my_c.history(incremental=True)
+    assert len(my_c.my_coinbase) == 152
+    assert os.path.isfile(fake_configuration.config_folder + "/my_coinbase.parquet")
+    assert my_c.cursors["account-0"]["id"] == "account-0-tx-149"
+
+    client.add_transaction("account-1", {
+        "id": "account-1-tx-new",
+        "resource": "transaction",
+        "type": "send",
+        "created_at": "2022-01-01T00:00:00Z",
+        "amount": {"amount": "-0.5", "currency": "C1"},
+        "native_amount": {"amount": "-5.0", "currency": "EUR"},
+    })
+    client.calls.clear()
+    my_c.history(incremental=True)
+    # one request per account, no full pagination
+    assert client.calls["get_transactions"] == 2
+    assert len(my_c.my_coinbase) == 153
+    assert my_c.my_coinbase["transaction_id"].is_unique
+    assert my_c.cursors["account-1"]["id"] == "account-1-tx-new"
+
+    client.calls.clear()
+    my_c.history(incremental=True)
+    assert client.calls["get_transactions"] == 2
+    assert len(my_c.my_coinbase) == 153
+
+
+def test_history_detail_cache(fake_configuration):
+    accounts = [
+        make_account(0, 40, transaction_type="buy"),
+        make_account(1, 10, transaction_type="fiat_deposit"),
+        ]
+    client = FakeClient(accounts, make_details(accounts))
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    my_c.history(cache=True)
+    assert client.calls["get_buy"] == 40
+    assert my_c.detail_cache.misses == 50
+    assert my_c.my_coinbase["total_fee"].round(2).eq(0.15).all()
+
+    # new session, loaded from the persisted file
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    client.calls.clear()
+    my_c.history(cache=True)
+    assert client.calls["get_buy"] + client.calls["get_deposit"] == 0
+    assert my_c.detail_cache.hits == 50
+
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    my_c.history(cache=True, cache_size=45)
+    assert len(my_c.detail_cache) == 45
+
+
+def test_history_typed_store(fake_configuration):
+    accounts = [
+        make_account(0, 30, transaction_type="buy"),
+        make_account(1, 5, currency="EUR", transaction_type="fiat_deposit"),
+        ]
+    client = FakeClient(accounts, make_details(accounts))
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    my_c.history()
+    df = my_c.my_coinbase
+    assert my_c.my_coinbase_obj is None
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert str(df.index.tz) == "UTC"
+    assert isinstance(df["type"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["symbol"].dtype, pd.CategoricalDtype)
+    assert df["total_fee"].dtype == "float64"
+
+    my_c.save_history()
+    client.calls.clear()
+    stored = read_history(fake_configuration.config_folder + "/my_coinbase.parquet")
+    assert sum(client.calls.values()) == 0
+    pd.testing.assert_frame_equal(stored, df)
+
+    my_c.history(keep_objects=True)
+    assert len(my_c.my_coinbase_obj) == 35
+
+
+def test_async_history(fake_configuration):
+    accounts = [
+        make_account(0, 130, transaction_type="buy"),
+        make_account(1, 20, transaction_type="sell"),
+        make_account(2, 7),
+        ]
+    client = FakeClient(accounts, make_details(accounts))
+    my_c = make_mycoinbase(fake_configuration, client, active_accounts=False)
+    my_c.history()
+
+    async def main():
+        async with await AsyncMyCoinbase.create(
+                max_concurrency=4, active_accounts=False, configuration=fake_configuration
+                ) as amc:
+            df = await amc.history()
+            return amc, df
+
+    with patch("surfingcrypto.coinbase.Client", return_value=client):
+        client.calls.clear()
+        amc, df = asyncio.run(main())
+    assert client.calls["get_buy"] == 130
+    assert client.calls["get_sell"] == 20
+    assert len(amc.accounts) == 3
+    pd.testing.assert_frame_equal(df, my_c.my_coinbase)
+
+
+def test_fx_table(fake_configuration):
+    client = FakeClient(prices={"BTC": 20000.0, "USD": 0.8, "CHF": 1.0})
+    fx = FxTable(fake_configuration)
+    fx.refresh(client, date="2021-01-02")
+    client.prices = {"BTC": 30000.0, "USD": 0.9, "CHF": 1.0}
+    fx.refresh(client, date="2021-01-05")
+    assert client.calls["get_exchange_rates"] == 2
+
+    # reloaded from the stored table
+    fx = FxTable(fake_configuration)
+    assert len(fx.rates) == 2
+    dates = pd.DatetimeIndex(["2020-12-01", "2021-01-03", "2021-01-06"], tz="utc")
+    np.testing.assert_allclose(fx.factor("EUR", "USD", dates), [1 / 0.8, 1 / 0.8, 1 / 0.9])
+    np.testing.assert_allclose(fx.factor(["BTC", "USD"], "CHF"), [30000.0, 0.9])
+    assert np.isnan(fx.factor("XYZ", "EUR"))[0]
+
+    df = pd.DataFrame({"nat_symbol": ["EUR", "USD", "CHF"], "native_amount": [10.0, 10.0, 10.0]},
+                      index=dates)
+    converted = fx.convert(df, "USD", ["native_amount"], "nat_symbol", df.index)
+    np.testing.assert_allclose(converted["native_amount"], [12.5, 10.0, 10 / 0.9])
+    assert (converted["nat_symbol"] == "USD").all()
+
+    # aware dates are converted to the UTC day
+    fx.refresh(client, date=pd.Timestamp("2021-01-05 23:00", tz="US/Eastern"))
+    fx.refresh(client, date=pd.Timestamp("2021-01-02 00:30", tz="Europe/Rome"))
+    assert list(fx.rates.index) == list(pd.DatetimeIndex(["2021-01-01", "2021-01-02", "2021-01-05", "2021-01-06"], tz="utc"))
+
+
+def test_mycoinbase_report_currency(fake_configuration):
+    client = FakeClient([make_account(i, 1) for i in range(3)], prices={"USD": 0.8})
+    my_c = make_mycoinbase(fake_configuration, client)
+    assert my_c.mycoinbase_report().endswith("Portfolio: EUR 30.00")
+    with pytest.raises(ValueError):
+        my_c.mycoinbase_report("USD")
+    fx = FxTable(fake_configuration)
+    fx.refresh(client)
+    assert my_c.mycoinbase_report("USD", fx).endswith("Portfolio: USD 37.50")
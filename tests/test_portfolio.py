@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from surfingcrypto.coinbase import FxTable, QuoteService
+from surfingcrypto.portfolio import PortfolioAnalysis, TransactionIndex
+from surfingcrypto.testing import FakeClient
+
+
+def make_history(n_trades=100, n_others=100, seed=0):
+    """
+    synthetic coinbase history: trades of two legs (sell then buy),
+    buys, sells and sends without trade id.
+    """
+    rng = np.random.default_rng(seed)
+    n = 2 * n_trades + n_others
+    amount = rng.random(n) + 0.1
+    native_amount = amount * 100
+    types = np.array(["trade"] * 2 * n_trades + list(rng.choice(["buy", "sell", "send"], n_others)),
+                     dtype=object)
+    amount[:2 * n_trades:2] *= -1
+    trade_id = np.array([f"trade-{i // 2}" for i in range(2 * n_trades)] + [None] * n_others,
+                        dtype=object)
+    df = pd.DataFrame({
+        "type": types,
+        "amount": amount,
+        "symbol": rng.choice(["BTC", "ETH"], n),
+        "native_amount": native_amount,
+        "total_fee": np.where(types == "trade", np.nan, 0.5),
+        "trade_id": trade_id,
+    }, index=pd.DatetimeIndex(
+        pd.Timestamp("2021-01-01", tz="utc") + pd.to_timedelta(np.arange(n), unit="min"),
+        name="datetime"))
+    return df.sample(frac=1, random_state=seed)
+
+
+def reference_fees(std_df):
+    """
+    fees of the legs of each trade, one trade at a time.
+    """
+    fees = {}
+    for trade in std_df.trade_id.dropna().unique():
+        t = std_df[std_df["trade_id"] == trade]
+        fees[trade] = t["native_amount"].diff().iloc[-1] / 2
+    return fees
+
+
+def test_standardize():
+    df = make_history()
+    p = PortfolioAnalysis(df)
+    assert set(p.std_df["type"]) == {"buy", "sell"}
+    assert (p.std_df["amount"] >= 0).all()
+    assert len(p.malformed_trades) == 0
+    fees = reference_fees(p.std_df)
+    traded = p.std_df["trade_id"].notna()
+    expected = p.std_df.loc[traded, "trade_id"].map(fees)
+    np.testing.assert_allclose(p.std_df.loc[traded, "total_fee"], expected)
+    assert (p.std_df.loc[~traded, "total_fee"] == 0.5).all()
+
+
+def test_standardize_malformed():
+    df = make_history(n_trades=10, n_others=0)
+    orphan = df[df["trade_id"] == "trade-3"].iloc[:1]
+    extra = df[df["trade_id"] == "trade-5"].iloc[:1]
+    df = pd.concat([df[df["trade_id"] != "trade-3"], orphan, extra])
+    p = PortfolioAnalysis(df)
+    report = p.malformed_trades.set_index("trade_id")
+    assert report.loc["trade-3", "legs"] == 1
+    assert report.loc["trade-5", "legs"] == 3
+    assert report.loc["trade-5", "error"] == "More than 2 trades found."
+    assert p.std_df.loc[p.std_df["trade_id"].isin(["trade-3", "trade-5"]), "total_fee"].isna().all()
+    assert p.std_df.loc[p.std_df["trade_id"] == "trade-1", "total_fee"].notna().all()
+    with pytest.raises(ValueError):
+        p.standardize(strict=True)
+
+
+def test_standardize_scale():
+    df = make_history(n_trades=25000, n_others=10000)
+    std_df = PortfolioAnalysis(df).std_df
+    traded = std_df[std_df["trade_id"].notna()]
+    legs = traded.groupby("trade_id", sort=False)["native_amount"].agg(["first", "last"])
+    expected = traded["trade_id"].map((legs["last"] - legs["first"]) / 2)
+    np.testing.assert_allclose(traded["total_fee"], expected)
+
+
+def test_portfolio_value():
+    client = FakeClient(prices={"BTC": 20000.0, "ETH": 1000.0, "ADA": 1.0})
+    df = make_history(n_trades=0, n_others=50)
+    p = PortfolioAnalysis(df)
+    value = p.portfolio_value(client)
+    held = df[df["type"].isin(["buy", "sell", "trade", "send"])].groupby("symbol")["amount"].sum()
+    assert list(value["symbol"]) == list(held.index)
+    np.testing.assert_allclose(value["amount"], held)
+    np.testing.assert_allclose(
+        value["live_value"], held * held.index.map(client.prices).to_numpy())
+    p.portfolio_value(client)
+    assert client.calls == {"get_exchange_rates": 1}
+
+    p.portfolio_value(client, ttl=0)
+    p.portfolio_value(client, ttl=0)
+    assert client.calls["get_exchange_rates"] == 3
+    assert p.quote_service.requests == 2
+
+    # a given quote service keeps its own ttl
+    quotes = QuoteService(client, ttl=3600)
+    p.portfolio_value(quotes)
+    p.portfolio_value(quotes)
+    assert quotes.ttl == 3600 and quotes.requests == 1
+    with pytest.raises(ValueError):
+        p.portfolio_value(quotes, currency="USD")
+
+
+def test_quote_service():
+    client = FakeClient(prices={"BTC": 20000.0, "ETH": 1000.0})
+    quotes = QuoteService(client, ttl=60)
+    prices = quotes.quotes(["BTC", "ETH", "XYZ"])
+    assert prices["BTC"] == pytest.approx(20000.0)
+    assert np.isnan(prices["XYZ"])
+    assert quotes.quote("ETH") == pytest.approx(1000.0)
+    assert client.calls["get_exchange_rates"] == 1
+    quotes.invalidate()
+    quotes.quote("ETH")
+    assert client.calls["get_exchange_rates"] == 2
+
+
+def write_closes(folder, symbols, start="2020-12-25", days=20, seed=0):
+    """
+    random daily closes of `symbols` in `folder/ts/<symbol>.csv`.
+    """
+    rng = np.random.default_rng(seed)
+    (folder / "ts").mkdir()
+    dates = pd.date_range(start, periods=days, freq="1D", tz="utc")
+    for symbol in symbols:
+        pd.DataFrame({"Date": dates, "Close": rng.lognormal(3, 1, days)}).to_csv(
+            folder / "ts" / (symbol + ".csv"), index=False)
+
+
+def test_value_timeline(fake_configuration, tmp_path):
+    write_closes(tmp_path, ["BTC", "ETH"])
+    df = make_history(n_trades=50, n_others=200)
+    df.index = df.index + pd.to_timedelta(np.arange(len(df)) * 37, unit="min")
+    # signed as in coinbase history, coins sent out are negative
+    df.loc[df["type"] == "sell", "amount"] *= -1
+    df.loc[(df["type"] == "send") & (np.arange(len(df)) % 2 == 0), "amount"] *= -1
+    p = PortfolioAnalysis(df)
+    value = p.value_timeline(fake_configuration)
+    assert list(value.columns) == ["BTC", "ETH", "total"]
+    assert value.index[0] == pd.Timestamp("2021-01-01", tz="utc")
+
+    std = p.std_df
+    sends = df[df["type"] == "send"]
+    qty = pd.concat([std["amount"].where(std["type"] == "buy", -std["amount"]), sends["amount"]])
+    symbols = pd.concat([std["symbol"], sends["symbol"]])
+    balance = p.transactions.balance()
+    for symbol in ["BTC", "ETH"]:
+        closes = pd.read_csv(tmp_path / "ts" / (symbol + ".csv"), index_col="Date", parse_dates=True)
+        for date, v in value[symbol].items():
+            held = qty[(symbols == symbol) & (qty.index < date + pd.Timedelta(days=1))].sum()
+            assert v == pytest.approx(held * closes.loc[:date, "Close"].iloc[-1])
+        # sends included, as in the balance of portfolio_value
+        assert value[symbol].iloc[-1] == pytest.approx(balance[symbol] * closes["Close"].iloc[-1])
+    np.testing.assert_allclose(value["total"], value["BTC"] + value["ETH"])
+
+    weekly = p.value_timeline(fake_configuration, freq="7D")
+    pd.testing.assert_frame_equal(weekly, value.iloc[::7], check_freq=False)
+
+    # naive dates are UTC, aware ones are converted
+    naive = p.value_timeline(fake_configuration, start="2021-01-03", end="2021-01-05")
+    aware = p.value_timeline(
+        fake_configuration,
+        start=pd.Timestamp("2021-01-03 01:00", tz="Europe/Rome"),
+        end=pd.Timestamp("2021-01-04 19:00", tz="US/Eastern"),
+        )
+    pd.testing.assert_frame_equal(naive, value.loc["2021-01-03":"2021-01-05"], check_freq=False)
+    pd.testing.assert_frame_equal(aware, naive)
+
+
+def test_value_timeline_missing(fake_configuration, tmp_path):
+    write_closes(tmp_path, ["BTC"])
+    p = PortfolioAnalysis(make_history())
+    value = p.value_timeline(fake_configuration)
+    assert list(value.columns) == ["BTC", "total"]
+    assert p.missing_timeseries == ["ETH"]
+    np.testing.assert_allclose(value["total"], value["BTC"])
+
+    (tmp_path / "ts" / "BTC.csv").unlink()
+    assert len(p.value_timeline(fake_configuration)) == 0
+    assert p.missing_timeseries == ["BTC", "ETH"]
+
+    deposits = make_history(n_trades=0, n_others=10).assign(type="fiat_deposit")
+    empty = PortfolioAnalysis(deposits).value_timeline(fake_configuration)
+    assert len(empty) == 0 and list(empty.columns) == ["total"]
+
+
+def test_transaction_index():
+    df = make_history(n_trades=200, n_others=500, seed=1)
+    df.index = df.index + pd.to_timedelta(np.arange(len(df)) * 97, unit="min")
+    index = TransactionIndex(df)
+    ordered = df.sort_index(kind="stable")
+    pd.testing.assert_frame_equal(index.select(), ordered)
+
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        start, end = np.sort(rng.choice(df.index, 2))
+        symbol = rng.choice(["BTC", "ETH"])
+        rows = ordered.loc[start:end]
+        pd.testing.assert_frame_equal(index.select(start, end), rows)
+        pd.testing.assert_frame_equal(
+            index.select(start, end, symbol=symbol, type=["buy", "sell"]),
+            rows[(rows["symbol"] == symbol) & rows["type"].isin(["buy", "sell"])])
+        assert index.total("total_fee", start, end) == pytest.approx(rows["total_fee"].sum())
+        pd.testing.assert_series_equal(
+            index.totals("amount", "symbol", start, end),
+            rows.groupby("symbol")["amount"].sum(), check_exact=False)
+        expected = ordered.loc[:end]
+        expected = expected[expected["type"].isin(["buy", "sell", "trade", "send"])]
+        pd.testing.assert_series_equal(
+            index.balance(end), expected.groupby("symbol")["amount"].sum(), check_exact=False)
+
+    monthly = index.resample("total_fee", "MS")
+    expected = ordered["total_fee"].resample("MS").sum()
+    np.testing.assert_allclose(monthly, expected)
+    assert (monthly.index == expected.index).all()
+    start, end = ordered.index[10], ordered.index[-10]
+    pd.testing.assert_series_equal(
+        index.resample("amount", "7D", start.tz_convert("Asia/Tokyo"), end.tz_convert("US/Eastern")),
+        index.resample("amount", "7D", start.tz_localize(None), end.tz_localize(None)))
+    with pytest.raises(ValueError):
+        index.totals("amount", "trade_id")
+
+
+def test_transaction_index_append():
+    df = make_history(n_trades=100, n_others=300, seed=2)
+    df.index = df.index + pd.to_timedelta(np.arange(len(df)) * 11, unit="min")
+    ordered = df.sort_index(kind="stable")
+    p = PortfolioAnalysis(ordered.iloc[:300])
+    p.append(ordered.iloc[300:500])
+    # older than the indexed transactions
+    p.append(ordered.iloc[500:].iloc[::-1].set_axis(ordered.index[500:][::-1] - pd.Timedelta(days=30)))
+    rebuilt = PortfolioAnalysis(p.df)
+    pd.testing.assert_frame_equal(p.transactions.select(), rebuilt.transactions.select())
+    assert p.total_fees() == pytest.approx(df["total_fee"].sum())
+    pd.testing.assert_frame_equal(
+        p.total_by_type(), df.groupby("type")[["native_amount"]].sum(), check_exact=False)
+    for key, g in rebuilt.transactions.groups.items():
+        np.testing.assert_allclose(p.transactions.groups[key]["prefix"], g["prefix"])
+
+
+def test_convert(fake_configuration):
+    fx = FxTable(fake_configuration)
+    fx.update(pd.DataFrame({"EUR": [1.0, 1.0], "USD": [1.25, 1.1]},
+                           index=pd.DatetimeIndex(["2020-12-31", "2021-01-01 12:00"])))
+    df = make_history(n_trades=0, n_others=2000)
+    df.index = df.index - pd.Timedelta(hours=12)
+    df["nat_symbol"] = pd.Categorical(["EUR"] * len(df))
+    p = PortfolioAnalysis(df)
+    converted = p.convert(fx, "USD")
+    # rates of a day apply from its start
+    expected = np.where(df.index < pd.Timestamp("2021-01-01", tz="utc"), 1.25, 1.1)
+    np.testing.assert_allclose(converted["native_amount"], df["native_amount"] * expected)
+    np.testing.assert_allclose(converted["total_fee"], df["total_fee"] * expected)
+    assert (converted["nat_symbol"] == "USD").all()
+    assert len(p.convert(fx, "USD", standard=True)) == len(p.std_df)
@@ -1,7 +1,12 @@
 import unittest 
-from surfingcrypto.portfolio_tracker import Tracker 
+from types import SimpleNamespace
+from surfingcrypto.portfolio_tracker import (
+    Tracker, fifo_lots, lots_timeline, iter_lots_timeline, load_price_panel, read_closes,
+    equal_weight_index, evaluate_scenarios, dca_ledger, holdings_matrix, calc_columns, lookup
+    )
 from surfingcrypto.config import config
 import pytest
+import numpy as np
 import pandas as pd
 @pytest.mark.skip
 class TestTracker(unittest.TestCase):
@@ -35,4 +40,403 @@ class TestTracker(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+
+def make_trades(n, n_symbols=20, seed=0):
+    """
+    synthetic transactions, about 60% buys.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Open date": pd.Timestamp("2018-01-01", tz="utc")
+            + pd.to_timedelta(rng.integers(0, 10**8, n), unit="s"),
+        "Type": np.where(rng.random(n) < 0.6, "buy", "sell"),
+        "Symbol": rng.choice([f"S{i}" for i in range(n_symbols)], n),
+        "Qty": rng.random(n),
+        "Adj cost per share": rng.random(n) * 100,
+    })
+
+
+def make_closes(calendar, symbols, seed=1):
+    """
+    random daily closes of symbols (price panel) and benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.DatetimeIndex(calendar, name="Date")
+    adj_close = pd.DataFrame(
+        rng.random((len(calendar), len(symbols))) + 1, index=calendar, columns=symbols)
+    benchmark = pd.Series(rng.random(len(calendar)) + 1, index=calendar)
+    return adj_close, benchmark
+
+
+@pytest.fixture
+def tracked(fake_configuration):
+    """
+    factory of trackers of random trades of 3 symbols from 2019-01-01 to 2020-06-01,
+    with random closes and benchmark and the lots open at the start.
+    """
+    def make(n=300, **kwargs):
+        portfolio = make_trades(n, n_symbols=3)
+        portfolio["Adj cost"] = portfolio["Qty"] * portfolio["Adj cost per share"]
+        t = Tracker(portfolio, fake_configuration, **kwargs)
+        t.stocks_start = pd.Timestamp("2019-01-01", tz="utc")
+        t.stocks_end = pd.Timestamp("2020-06-01", tz="utc")
+        adj_close, benchmark = make_closes(t.calendar, ["S0", "S1", "S2"])
+        active = t.portfolio_start_balance(t.portfolio_df, t.stocks_start)
+        return SimpleNamespace(tracker=t, adj_close=adj_close, benchmark=benchmark, active=active)
+    return make
+
+
+def reference_fifo(portfolio):
+    """
+    row by row FIFO matching, remaining quantity of each row.
+    """
+    remaining = {}
+    order = portfolio.assign(sell=portfolio["Type"] == "sell")
+    order = order.sort_values(["Open date", "sell"], kind="stable")
+    for i, row in order.iterrows():
+        if row["Type"] == "buy":
+            remaining[i] = row["Qty"]
+            continue
+        to_sell = row["Qty"]
+        for j in remaining:
+            if portfolio.loc[j, "Symbol"] != row["Symbol"] or remaining[j] == 0:
+                continue
+            take = min(to_sell, remaining[j])
+            remaining[j] -= take
+            to_sell -= take
+            if to_sell <= 0:
+                break
+    return pd.Series(remaining).reindex(portfolio.index, fill_value=0.0)
+
+
+def test_fifo_lots():
+    portfolio = pd.DataFrame({
+        "Open date": pd.to_datetime([
+            "2021-01-01 10:00", "2021-01-02 10:00", "2021-01-03 12:00",
+            "2021-01-04 09:00", "2021-01-02 11:00"], utc=True),
+        "Type": ["buy", "buy", "sell", "sell", "buy"],
+        "Symbol": ["BTC", "BTC", "BTC", "BTC", "ETH"],
+        "Qty": [1.0, 2.0, 1.5, 0.5, 3.0],
+        "Adj cost per share": [10.0, 20.0, 30.0, 40.0, 5.0],
+    })
+    remaining, realized = fifo_lots(portfolio)
+    np.testing.assert_allclose(remaining, [0, 1, 0, 0, 3])
+    assert realized["lot"].tolist() == [0, 1, 1]
+    assert realized["sale"].tolist() == [2, 2, 3]
+    np.testing.assert_allclose(realized["Qty"], [1.0, 0.5, 0.5])
+    np.testing.assert_allclose(realized["Realized Gain / (Loss)"], [20.0, 5.0, 10.0])
+    assert (realized["Close date"] >= realized["Open date"]).all()
+
+
+def test_fifo_lots_matches_reference():
+    portfolio = make_trades(2000, n_symbols=5)
+    remaining, realized = fifo_lots(portfolio)
+    np.testing.assert_allclose(remaining, reference_fifo(portfolio), atol=1e-9)
+    sold = realized.groupby("lot")["Qty"].sum()
+    bought = portfolio["Qty"].iloc[sold.index]
+    np.testing.assert_allclose(sold + remaining[sold.index], bought, atol=1e-9)
+
+
+def test_fifo_lots_scale():
+    portfolio = make_trades(100000)
+    remaining, realized = fifo_lots(portfolio)
+    qty = portfolio["Qty"].to_numpy()
+    buys = (portfolio["Type"] == "buy").to_numpy()
+    assert (remaining[~buys] == 0).all() and (remaining >= 0).all()
+    # every lot is either still open or closed by sales of the same symbol
+    closed = np.bincount(realized["lot"], weights=realized["Qty"], minlength=len(portfolio))
+    np.testing.assert_allclose(remaining[buys] + closed[buys], qty[buys])
+    assert (closed[~buys] == 0).all()
+    assert (portfolio["Symbol"].to_numpy()[realized["sale"]] == realized["Symbol"]).all()
+    sold = np.bincount(realized["sale"], weights=realized["Qty"], minlength=len(portfolio))
+    assert (sold <= qty + 1e-9).all()
+    # lots are opened before the sales that close them
+    assert (portfolio["Open date"].to_numpy()[realized["lot"]]
+            <= portfolio["Open date"].to_numpy()[realized["sale"]]).all()
+
+
+def test_lots_timeline():
+    portfolio = make_trades(500, n_symbols=3)
+    calendar = pd.date_range("2018-01-01", "2021-03-01", freq="1D", tz="utc")
+    daily = lots_timeline(portfolio, calendar)
+    for date in calendar[::97]:
+        until = portfolio[portfolio["Open date"] <= date]
+        expected = reference_fifo(until)
+        expected = expected[expected > 1e-12]
+        snapshot = daily[daily["Date Snapshot"] == date]
+        assert snapshot["Qty"].sum() == pytest.approx(expected.sum())
+        assert len(snapshot) == len(expected)
+
+
+def test_holdings_matrix_matches_lots(tracked):
+    tr = tracked(400)
+    t, adj_close, benchmark, active = tr.tracker, tr.adj_close, tr.benchmark, tr.active
+
+    holdings = t.time_fill(active)
+    assert holdings.shape == (len(t.calendar), 4 * 3)
+    lots = t.per_day_portfolio_calcs(
+        t.time_fill(active, long=True), benchmark, adj_close, t.stocks_start)
+    dense = t.per_day_portfolio_calcs(holdings, benchmark, adj_close, t.stocks_start)
+
+    columns = ["Qty", "Adj cost", "Adj cost daily", "Stock Gain / (Loss)",
+               "Benchmark Gain / (Loss)", "Abs Value Compare"]
+    expected = lots.groupby(["Date Snapshot", "Symbol"])[columns].sum()
+    result = dense.set_index(["Date Snapshot", "Symbol"])[columns]
+    pd.testing.assert_frame_equal(result, expected, check_exact=False)
+
+
+def test_update_incremental(tracked):
+    full = tracked(400)
+    calendar, adj_close, benchmark = full.tracker.calendar, full.adj_close, full.benchmark
+    expected = full.tracker.per_day_portfolio_calcs(
+        full.tracker.time_fill(full.active), benchmark, adj_close, calendar[0])
+
+    t = tracked(400).tracker
+    first = calendar[0]
+    for end in [calendar[200], calendar[201], calendar[350], calendar[-1]]:
+        t.stocks_end = end
+        new = t.update(benchmark, adj_close)
+        assert new["Date Snapshot"].min() == first
+        assert new["Date Snapshot"].max() == end
+        first = end + pd.Timedelta(days=1)
+    assert t.load_state()["last_date"] == calendar[-1].isoformat()
+    assert len(t.update(benchmark, adj_close)) == 0
+
+    columns = ["Date Snapshot", "Symbol", "Qty", "Adj cost", "symbol Share Value",
+               "Stock Gain / (Loss)", "Benchmark Gain / (Loss)", "Abs. Return Compare"]
+    pd.testing.assert_frame_equal(
+        t.load_results()[columns], expected[columns], check_exact=False)
+
+
+def test_update_stale_state(tracked):
+    tr = tracked()
+    t, calendar = tr.tracker, tr.tracker.calendar
+    t.update(tr.benchmark, tr.adj_close)
+    assert t.load_state()["benchmarks"] == [None]
+
+    # other benchmarks, computed again from the start
+    benchmarks, _ = make_closes(calendar, ["BTC", "ETH"], seed=2)
+    t = tracked().tracker
+    new = t.update(benchmarks, tr.adj_close)
+    assert new["Date Snapshot"].min() == calendar[0]
+    assert len(t.load_results()) == len(new)
+    assert len(t.update(benchmarks, tr.adj_close)) == 0
+
+    # later start
+    t = tracked().tracker
+    t.stocks_start = calendar[100]
+    new = t.update(benchmarks.loc[calendar[100]:], tr.adj_close.loc[calendar[100]:])
+    assert new["Date Snapshot"].min() == calendar[100]
+    assert t.load_state()["stocks_start"] == calendar[100].isoformat()
+    assert len(t.load_results()) == len(new)
+
+
+def test_load_price_panel(fake_configuration, tmp_path):
+    (tmp_path / "ts").mkdir()
+    dates = pd.date_range("2021-01-01", periods=10, freq="1D", tz="utc")
+    for i, coin in enumerate(["BTC", "ETH"]):
+        pd.DataFrame({
+            "Date": dates, "Open": 0.0, "Close": np.arange(10.0) + 100 * i
+            }).to_csv(tmp_path / "ts" / f"{coin}.csv", index=False)
+    calendar = pd.date_range("2021-01-03", periods=10, freq="1D", tz="utc")
+    bounds = {
+        "BTC": {"start": dates[0], "end_day": dates[-1]},
+        "ETH": {"start": dates[4], "end_day": dates[-1]},
+        }
+    cache = {}
+    panel, errors = load_price_panel(
+        fake_configuration, ["BTC", "ETH", "XYZ"], calendar, bounds=bounds, cache=cache)
+    assert list(panel.columns) == ["BTC", "ETH"]
+    assert [e["symbol"] for e in errors] == ["XYZ"]
+    assert panel.index.equals(calendar)
+    assert panel.loc[calendar[0], "BTC"] == 2.0
+    assert np.isnan(panel.loc[calendar[0], "ETH"])
+    assert panel.loc[calendar[2], "ETH"] == 104.0
+    assert panel.iloc[-1].isna().all()
+    assert read_closes(fake_configuration, "BTC", cache) is cache["BTC"]
+    assert (tmp_path / "ts" / "BTC.feather").is_file()
+    pd.testing.assert_series_equal(read_closes(fake_configuration, "BTC"), cache["BTC"])
+
+
+def test_lookup():
+    calendar = pd.date_range("2021-01-01", periods=3, freq="1D", tz="utc")
+    panel = pd.DataFrame({"BTC": [1.0, 2.0, 3.0]}, index=calendar)
+    dates = calendar[[0, 2, 1]].append(pd.DatetimeIndex(["2022-01-01"], tz="utc"))
+    np.testing.assert_array_equal(
+        lookup(panel, dates, ["BTC", "BTC", "ETH", "BTC"]), [1.0, 3.0, np.nan, np.nan])
+    # every symbol failed to load
+    assert np.isnan(lookup(panel[[]], dates, ["BTC"] * 4)).all()
+
+
+def test_iter_lots_timeline():
+    portfolio = make_trades(500, n_symbols=3)
+    calendar = pd.date_range("2018-01-01", "2021-03-01", freq="1D", tz="utc")
+    expected = lots_timeline(portfolio, calendar)
+    frames = list(iter_lots_timeline(portfolio, calendar, max_rows=5000))
+    assert len(frames) > 1
+    assert all(len(df) <= 5000 for df in frames)
+    # frames cover whole, consecutive days
+    for a, b in zip(frames[:-1], frames[1:]):
+        assert a["Date Snapshot"].max() < b["Date Snapshot"].min()
+    result = pd.concat(frames)
+    keys = ["Date Snapshot", "Open date", "Symbol"]
+    pd.testing.assert_frame_equal(
+        result.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True))
+
+
+def test_per_day_portfolio_calcs_chunks(tracked, tmp_path):
+    tr = tracked()
+    t, adj_close, benchmark, active = tr.tracker, tr.adj_close, tr.benchmark, tr.active
+
+    args = (benchmark, adj_close, t.stocks_start)
+    keys = ["Date Snapshot", "Open date", "Symbol"]
+    expected = t.per_day_portfolio_calcs(t.time_fill(active, long=True), *args)
+    expected = expected.sort_values(keys, ignore_index=True)
+    chunks = list(t.iter_portfolio_calcs(t.iter_time_fill(active, 1000), *args, memory_budget=10**5))
+    assert len(chunks) > 1
+    result = pd.concat(chunks).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected)
+
+    holdings = t.time_fill(active)
+    expected = t.per_day_portfolio_calcs(holdings, *args, memory_budget=10**9)
+    assert t.per_day_portfolio_calcs(holdings, *args, memory_budget=10**4, path=str(tmp_path / "out")) is None
+    result = pd.read_parquet(tmp_path / "out")
+    pd.testing.assert_frame_equal(result, expected, check_freq=False, check_index_type=False)
+
+
+@pytest.mark.parametrize("long", [False, True])
+def test_multiple_benchmarks(tracked, long):
+    tr = tracked()
+    t, adj_close, active = tr.tracker, tr.adj_close, tr.active
+    benchmarks, _ = make_closes(t.calendar, ["BTC", "ETH"], seed=2)
+    benchmarks["Equal weight"] = equal_weight_index(adj_close)
+    assert benchmarks["Equal weight"].iloc[0] == pytest.approx(1.0)
+
+    result = t.per_day_portfolio_calcs(
+        t.time_fill(active, long=long), benchmarks, adj_close, t.stocks_start)
+    for name in benchmarks.columns:
+        single = t.per_day_portfolio_calcs(
+            t.time_fill(active, long=long), benchmarks[name], adj_close, t.stocks_start)
+        for column in ["Benchmark Return", "Equiv Benchmark Shares",
+                       "Benchmark Gain / (Loss)", "Abs. Return Compare"]:
+            np.testing.assert_allclose(result[f"{column} {name}"], single[column])
+        assert "Benchmark Return" not in result
+
+
+def test_chunks_with_benchmarks(tracked):
+    tr = tracked()
+    t = tr.tracker
+    benchmarks, _ = make_closes(t.calendar, [f"B{i}" for i in range(5)], seed=2)
+    assert calc_columns(benchmarks) - calc_columns(tr.benchmark) == 4 * 11
+    holdings = t.time_fill(tr.active)
+    args = (tr.adj_close, t.stocks_start)
+    single = list(t.iter_portfolio_calcs(holdings, tr.benchmark, *args, memory_budget=10**5))
+    chunks = list(t.iter_portfolio_calcs(holdings, benchmarks, *args, memory_budget=10**5))
+    assert len(chunks) > len(single)
+    assert max(len(c) for c in chunks) * 8 * calc_columns(benchmarks) <= 10**5
+
+
+def test_set_benchmark_list(fake_configuration, tmp_path):
+    (tmp_path / "ts").mkdir()
+    dates = pd.date_range("2021-01-01", periods=10, freq="1D", tz="utc")
+    for coin in ["BTC", "ETH"]:
+        pd.DataFrame({"Date": dates, "Close": np.arange(10.0)}).to_csv(
+            tmp_path / "ts" / f"{coin}.csv", index=False)
+    portfolio = make_trades(10)
+    t = Tracker(portfolio, configuration=fake_configuration)
+    t.stocks_start, t.stocks_end = dates[1], dates[-2]
+    benchmarks = t.set_benchmark(["BTC", "ETH"])
+    assert list(benchmarks.columns) == ["BTC", "ETH"]
+    assert benchmarks.index.equals(t.calendar)
+    t.stocks_end = dates[-1] + pd.Timedelta(days=1)
+    with pytest.raises(ValueError):
+        t.set_benchmark(["BTC", "ETH"])
+
+
+def test_benchmark_run():
+    from benchmarks.bench_portfolio_tracker import run, STAGES
+    results = run(symbols=3, trades=300, days=60)
+    assert [r["stage"] for r in results] == STAGES
+    assert all(r["seconds"] >= 0 and r["peak_mb"] >= 0 for r in results)
+    rows = {r["stage"]: r.get("rows") for r in results}
+    assert rows["calc_returns"] == rows["concat_lots"]
+
+
+def test_evaluate_scenarios():
+    calendar = pd.date_range("2018-01-01", "2021-03-01", freq="1D", tz="utc")
+    prices, _ = make_closes(calendar, [f"S{i}" for i in range(20)])
+    scenarios = {f"random {i}": make_trades(300, seed=i) for i in range(5)}
+    for i in range(5):
+        scenarios[f"dca {i}"] = dca_ledger(prices, {"S0": 1, "S1": 3}, 100, calendar[100 * i])
+
+    summary, values = evaluate_scenarios(scenarios, prices, shard_size=3, daily=True)
+    assert list(summary.index) == list(scenarios)
+    assert list(values.columns) == list(scenarios)
+    for name, ledger in scenarios.items():
+        holdings = holdings_matrix(ledger, calendar)["Qty"]
+        expected = (holdings * prices[holdings.columns]).sum(axis=1)
+        np.testing.assert_allclose(values[name], expected, atol=1e-9)
+    dca = summary.loc["dca 2"]
+    weeks = len(pd.date_range(calendar[200], calendar[-1], freq="7D"))
+    assert dca["Invested"] == pytest.approx(100 * weeks)
+    assert dca["Proceeds"] == 0
+    assert dca["Final Value"] == pytest.approx(values["dca 2"].iloc[-1])
+    assert dca["Return"] == pytest.approx(dca["Final Value"] / dca["Invested"] - 1)
+    assert (summary["Max Drawdown"] <= 0).all() and (summary["Max Drawdown"] >= -1).all()
+
+    pooled = evaluate_scenarios(scenarios, prices, shard_size=4, max_workers=2)
+    pd.testing.assert_frame_equal(pooled, summary)
+
+
+def test_evaluate_scenarios_drawdown():
+    calendar = pd.date_range("2021-01-01", periods=5, freq="1D", tz="utc")
+    prices = pd.DataFrame({"BTC": [10.0, 20.0, 10.0, 15.0, 30.0]}, index=calendar)
+    ledger = pd.DataFrame({
+        "Open date": [calendar[0], calendar[3]],
+        "Type": ["buy", "sell"],
+        "Symbol": ["BTC", "BTC"],
+        "Qty": [2.0, 1.0],
+        "Adj cost per share": [10.0, 15.0],
+    })
+    summary = evaluate_scenarios({"one": ledger}, prices).loc["one"]
+    assert summary["Invested"] == 20.0
+    assert summary["Proceeds"] == 15.0
+    assert summary["Final Value"] == 30.0
+    assert summary["Gain / (Loss)"] == 25.0
+    assert summary["Max Drawdown"] == pytest.approx(-0.5)
+    assert summary["Time Weighted Return"] == pytest.approx(2.0)
+
+
+@pytest.mark.parametrize("long", [False, True])
+def test_low_memory(tracked, long):
+    results = {}
+    for low_memory in [False, True]:
+        tr = tracked(low_memory=low_memory, float32=low_memory)
+        t = tr.tracker
+        results[low_memory] = t.per_day_portfolio_calcs(
+            t.time_fill(tr.active, long=long), tr.benchmark, tr.adj_close, t.stocks_start,
+            memory_budget=10**5)
+    compact, full = results[True], results[False]
+
+    assert isinstance(t.portfolio_df["Symbol"].dtype, pd.CategoricalDtype)
+    assert isinstance(compact["Symbol"].dtype, pd.CategoricalDtype)
+    assert "Adj cost daily" not in compact and "Benchmark End Date Close" not in compact
+    assert compact["Benchmark Return"].dtype == "float32"
+    assert compact["Adj cost"].dtype == "float64"
+    assert compact.memory_usage(deep=True).sum() < 0.6 * full.memory_usage(deep=True).sum()
+    for column in compact.columns:
+        if compact[column].dtype == "float32":
+            np.testing.assert_allclose(compact[column], full[column], rtol=1e-5)
+
+    assert t.drop_columns == ["Benchmark End Date Close", "Adj cost daily"]
+    t.drop_columns.append("Benchmark Close")
+    assert tracked(low_memory=True).tracker.drop_columns == ["Benchmark End Date Close", "Adj cost daily"]
+    with pytest.raises(ValueError):
+        tracked(low_memory=True, drop_columns=["Benchmark Share Value"])
+
+    report = t.memory_report()
+    assert list(report.index) == ["portfolio_df", "results"]
+    assert report.loc["results", "rows"] == len(compact)
+    assert (report["after"] < report["before"]).all()
@@ -0,0 +1,86 @@
+"""
+test transport module.
+"""
+import time
+from unittest.mock import patch, Mock
+
+import pytest
+import requests
+from coinbase.wallet.client import Client
+
+from surfingcrypto.transport import (
+    RateLimiter, TransportSession, endpoint, install_transport
+    )
+
+
+def response(status, headers=None):
+    return Mock(status_code=status, headers=headers or {})
+
+
+def test_rate_limiter_throttles():
+    limiter = RateLimiter(rate=100, capacity=1)
+    t = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - t >= 0.045
+
+
+def test_endpoint():
+    url = "https://api.coinbase.com/v2/accounts/e320257e-de91-574f-acd4-987dfd4b179a/transactions"
+    assert endpoint("get", url) == "GET /v2/accounts/{id}/transactions"
+    assert endpoint("get", "https://api.coinbase.com/v2/prices/BTC-EUR/spot") == "GET /v2/prices/BTC-EUR/spot"
+
+
+def test_retry_with_backoff():
+    session = TransportSession(rate=None, backoff_base=0.001)
+    responses = [response(429), response(503), response(200)]
+    with patch.object(requests.Session, "request", side_effect=responses) as request:
+        r = session.get("https://api.coinbase.com/v2/user")
+    assert r.status_code == 200
+    assert request.call_count == 3
+    metrics = session.metrics.summary().loc["GET /v2/user"]
+    assert metrics["calls"] == 3
+    assert metrics["errors"] == 2
+    assert metrics["retries"] == 2
+
+
+def test_retry_after_is_capped():
+    session = TransportSession(rate=None, backoff_max=2.0)
+    assert session.backoff(0, response(429, {"Retry-After": "1"})) == 1.0
+    assert session.backoff(0, response(429, {"Retry-After": "3600"})) == 2.0
+
+
+def test_retry_gives_up():
+    session = TransportSession(rate=None, max_retries=2, backoff_base=0.001)
+    with patch.object(requests.Session, "request", return_value=response(429)) as request:
+        r = session.get("https://api.coinbase.com/v2/user")
+    assert r.status_code == 429
+    assert request.call_count == 3
+
+
+def test_connection_errors_are_retried():
+    session = TransportSession(rate=None, max_retries=1, backoff_base=0.001)
+    with patch.object(requests.Session, "request", side_effect=requests.ConnectionError):
+        with pytest.raises(requests.ConnectionError):
+            session.get("https://api.coinbase.com/v2/user")
+    assert session.metrics.summary().loc["GET /v2/user", "errors"] == 2
+
+
+def test_install_transport():
+    client = Client("fake-key", "fake-secret")
+    auth = client.session.auth
+    transport = install_transport(client)
+    assert client.session is transport
+    assert transport.auth is auth
+    assert transport.headers["CB-VERSION"] == client.API_VERSION
+
+
+def test_cb_requests_go_through_transport(fake_configuration):
+    from surfingcrypto.coinbase import CB
+    user = response(200)
+    user.json.return_value = {"data": {"id": "fake-user", "resource": "user"}}
+    with patch.object(requests.Session, "request", return_value=user):
+        cb = CB(fake_configuration)
+    assert isinstance(cb.client.session, TransportSession)
+    assert cb.user["id"] == "fake-user"
+    assert cb.transport.metrics.summary().loc["GET /v2/user", "calls"] == 1
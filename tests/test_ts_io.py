@@ -0,0 +1,31 @@
+"""
+test reading of time series
+"""
+import os
+from unittest.mock import patch
+import pandas as pd
+
+from surfingcrypto.ts_io import read_ts
+
+
+def write_ts(path, days=100):
+    dates = pd.date_range("2021-01-01", periods=days, freq="1D", tz="utc")
+    pd.DataFrame({"Date": dates, "Open": 1.0, "Close": range(days)}).to_csv(path, index=False)
+
+
+def test_read_ts_sidecar(tmp_path):
+    path = str(tmp_path / "BTC.csv")
+    write_ts(path)
+    df = read_ts(path)
+    assert os.path.isfile(str(tmp_path / "BTC.feather"))
+    assert str(df.index.tz) == "UTC"
+
+    with patch("surfingcrypto.ts_io.pd.read_csv") as read_csv:
+        warm = read_ts(path)
+    read_csv.assert_not_called()
+    pd.testing.assert_frame_equal(warm, df)
+
+    # a changed .csv file invalidates the sidecar
+    write_ts(path, days=120)
+    assert len(read_ts(path)) == 120
+    assert len(read_ts(path, sidecar=False)) == 120